@@ -0,0 +1,165 @@
+"""
+Benchmarks for drf-hooks, run with `python -m benchmarks run` (or `make bench`).
+
+    python -m benchmarks run --output results/new.json
+    python -m benchmarks compare results/old.json results/new.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    import django
+
+    django.setup()
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    setup_django()
+    import django
+    from django.db import connection, transaction
+
+    from . import cases
+
+    selected = args.only or ["save", "serialize", "throughput"]
+    subscribers = [int(n) for n in args.subscribers.split(",")]
+    results = {}
+    old_name = connection.creation.create_test_db(verbosity=0, keepdb=args.keepdb)
+    try:
+        for name in selected:
+            print("Running %s..." % name, file=sys.stderr)
+            with transaction.atomic():
+                if name == "save":
+                    results.update(cases.bench_save(subscribers, repeat=args.repeat))
+                elif name == "serialize":
+                    results.update(cases.bench_serialize(repeat=args.repeat))
+                elif name == "throughput":
+                    results.update(
+                        cases.bench_throughput(
+                            deliveries=args.deliveries,
+                            threads=args.threads,
+                            latency=args.latency / 1000.0,
+                            error_rate=args.error_rate,
+                        )
+                    )
+                transaction.set_rollback(True)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=args.keepdb)
+
+    report = {
+        "revision": get_revision(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print_results(results)
+
+
+def format_value(result):
+    if result["unit"] == "s":
+        return "%.1f µs" % (result["median"] * 1e6)
+    return "%.0f %s" % (result["median"], result["unit"])
+
+
+def print_results(results):
+    for name, result in sorted(results.items()):
+        print("%-32s %16s" % (name, format_value(result)))
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print("%-32s %16s %16s %9s" % ("", base["revision"] or "base", new["revision"] or "new", ""))
+    regressions = []
+    for name in sorted(set(base["results"]) & set(new["results"])):
+        old_result, new_result = base["results"][name], new["results"][name]
+        change = new_result["median"] / old_result["median"] - 1
+        if new_result["better"] == "higher":
+            regressed = change < -args.threshold
+        else:
+            regressed = change > args.threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            "%-32s %16s %16s %+8.1f%%%s"
+            % (
+                name,
+                format_value(old_result),
+                format_value(new_result),
+                change * 100,
+                " !" if regressed else "",
+            )
+        )
+    if regressions:
+        print("\nRegressed by more than %d%%: %s" % (args.threshold * 100, ", ".join(regressions)))
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_run = commands.add_parser("run", help="Run the benchmarks.")
+    parser_run.add_argument(
+        "--only",
+        action="append",
+        choices=["save", "serialize", "throughput"],
+        help="Only run these benchmarks (repeatable).",
+    )
+    parser_run.add_argument("--output", help="Write the results to this JSON file.")
+    parser_run.add_argument("--repeat", type=int, default=5, help="Runs per measurement.")
+    parser_run.add_argument(
+        "--subscribers", default="1,100,10000", help="Comma separated subscriber counts."
+    )
+    parser_run.add_argument("--deliveries", type=int, default=2000)
+    parser_run.add_argument("--threads", type=int, default=8)
+    parser_run.add_argument(
+        "--latency", type=float, default=5, help="Stand-in server latency in ms."
+    )
+    parser_run.add_argument(
+        "--error-rate", type=float, default=0, help="Share of requests answered with a 500."
+    )
+    parser_run.add_argument("--keepdb", action="store_true", help="Keep the benchmark database.")
+
+    parser_compare = commands.add_parser("compare", help="Compare two result files.")
+    parser_compare.add_argument("base")
+    parser_compare.add_argument("new")
+    parser_compare.add_argument(
+        "--threshold", type=float, default=0.1, help="Relative change reported as a regression."
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return run(args)
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import statistics
+import time
+import timeit
+from contextlib import contextmanager, nullcontext
+
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.test import override_settings
+from django_comments.models import Comment
+
+from drf_hooks import client as client_module
+from drf_hooks.client import Client, DeliveryQueue, build_session
+from drf_hooks.models import Hook, get_dispatch_table
+from drf_hooks.retry import DeliveryPolicy
+
+from .server import StandInServer
+
+LOWER = "lower"
+HIGHER = "higher"
+
+
+class NullClient(object):
+    """Accepts deliveries and drops them, to measure drf-hooks without the network."""
+
+    def __init__(self):
+        self.count = 0
+
+    def batch(self):
+        return nullcontext()
+
+    def post(self, *args, **kwargs):
+        self.count += 1
+
+
+@contextmanager
+def null_client():
+    previous = getattr(client_module, "__CLIENT")
+    setattr(client_module, "__CLIENT", NullClient())
+    try:
+        yield
+    finally:
+        setattr(client_module, "__CLIENT", previous)
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """Seconds per call of `func`, as the stats of `repeat` runs of at least `min_time`."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(number, int(number * min_time / max(elapsed, 1e-9)))
+    runs = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "unit": "s",
+        "better": LOWER,
+        "number": number,
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "mean": statistics.mean(runs),
+        "stdev": statistics.stdev(runs) if len(runs) > 1 else 0.0,
+    }
+
+
+def setup_comment():
+    user = User.objects.create_user("bench", "bench@example.com", "password")
+    site = Site.objects.get_current()
+    comment = Comment.objects.create(site=site, content_object=user, user=user, comment="Bench")
+    return user, site, comment
+
+
+def bench_save(subscribers=(1, 100, 10000), repeat=5):
+    """Added latency of Model.save(), with every delivery dropped by a NullClient."""
+    user, site, comment = setup_comment()
+    results = {}
+    with null_client():
+        results["save.no_events"] = measure(site.save, repeat)
+
+        table = get_dispatch_table()
+        table.disconnect()
+        try:
+            results["save.without_drf_hooks"] = measure(comment.save, repeat)
+        finally:
+            table.connect()
+        results["save.no_subscribers"] = measure(comment.save, repeat)
+
+        created = 0
+        for count in subscribers:
+            Hook.objects.bulk_create(
+                Hook(user=user, event="comment.changed", target="http://127.0.0.1/%d" % i)
+                for i in range(created, count)
+            )
+            created = count
+            results["save.subscribers_%d" % count] = measure(comment.save, repeat)
+    Hook.objects.all().delete()
+    return results
+
+
+def bench_serialize(repeat=5):
+    """Cost of AbstractHook.serialize_model with and without HOOK_SERIALIZERS."""
+    user, site, comment = setup_comment()
+    results = {"serialize.drf": measure(lambda: Hook.serialize_model(comment), repeat)}
+    with override_settings(HOOK_SERIALIZERS={}):
+        results["serialize.fallback"] = measure(lambda: Hook.serialize_model(comment), repeat)
+    return results
+
+
+def bench_throughput(
+    deliveries=2000, threads=8, latency=0.005, error_rate=0.0, repeat=3, timeout=120
+):
+    """
+    Deliveries per second of the threaded Client against a local stand-in
+    server. Fails if a run takes longer than `timeout` seconds.
+    """
+    body = b'{"hook": {"id": 1}, "data": {"comment": "Bench"}}'
+    runs = []
+    with StandInServer(latency=latency, error_rate=error_rate) as server:
+        for _ in range(repeat):
+            client = Client(
+                num_threads=threads,
+                session=build_session(),
+                queue=DeliveryQueue(max_per_host=threads),
+                policy=DeliveryPolicy(max_retries=0, breaker_threshold=0),
+            )
+            started = time.perf_counter()
+            with client.batch():
+                for _ in range(deliveries):
+                    client.post(url=server.url, data=body, headers={})
+            if not client.drain(timeout):
+                raise RuntimeError(
+                    "%d deliveries left after %d seconds" % (client.undelivered, timeout)
+                )
+            runs.append(deliveries / (time.perf_counter() - started))
+    return {
+        "throughput.client": {
+            "unit": "deliveries/s",
+            "better": HIGHER,
+            "number": deliveries,
+            "min": min(runs),
+            "median": statistics.median(runs),
+            "mean": statistics.mean(runs),
+            "stdev": statistics.stdev(runs) if len(runs) > 1 else 0.0,
+            "threads": threads,
+            "latency": latency,
+            "error_rate": error_rate,
+        }
+    }
@@ -0,0 +1,8 @@
+from django_comments.models import Comment
+from rest_framework import serializers
+
+
+class CommentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Comment
+        fields = "__all__"
@@ -0,0 +1,52 @@
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Local HTTP server standing in for hook targets. Every request is answered
+    after `latency` seconds, with a 500 for a random `error_rate` of them and a
+    200 otherwise.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://%s:%d/hooks" % self.server_address
+
+    def __enter__(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        status = 500 if random.random() < self.server.error_rate else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,24 @@
+import os
+
+from tests.settings import *  # noqa: F403
+
+# SQLite in memory by default, set BENCH_DB_ENGINE=postgresql to use e.g.
+# docker run --rm -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres
+if os.environ.get("BENCH_DB_ENGINE", "sqlite3") != "sqlite3":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.%s" % os.environ["BENCH_DB_ENGINE"],
+            "NAME": os.environ.get("BENCH_DB_NAME", "postgres"),
+            "USER": os.environ.get("BENCH_DB_USER", "postgres"),
+            "PASSWORD": os.environ.get("BENCH_DB_PASSWORD", "postgres"),
+            "HOST": os.environ.get("BENCH_DB_HOST", "localhost"),
+            "PORT": os.environ.get("BENCH_DB_PORT", "5432"),
+            "TEST": {"NAME": "drf_hooks_benchmarks"},
+        }
+    }
+
+HOOK_SERIALIZERS = {
+    "django_comments.Comment": "benchmarks.serializers.CommentSerializer",
+}
+HOOK_THREADING = False
+HOOK_METRICS = None
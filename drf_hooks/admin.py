@@ -14,7 +14,17 @@ class HookForm(forms.ModelForm):
 
     class Meta:
         model = get_hook_model()
-        fields = ["user", "target", "event", "headers"]
+        fields = [
+            "user",
+            "target",
+            "event",
+            "headers",
+            "batch_size",
+            "batch_interval",
+            "filter",
+            "fields",
+            "content_encoding",
+        ]
 
     def __init__(self, *args, **kwargs):
         super(HookForm, self).__init__(*args, **kwargs)
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import weakref
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .client import get_client, get_timeout
+from .metrics import get_metrics
+from .retry import RETRY, DeliveryPolicy
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+__CLIENTS = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Returns the async client of the running event loop: an `AsyncClient` if
+    httpx is installed, otherwise the client of `get_client()` wrapped in a
+    `SyncClientAdapter`. Deliveries to the outbox or the spool directory always
+    go through `get_client()`.
+    """
+    loop = asyncio.get_running_loop()
+    client = __CLIENTS.get(loop)
+    if client is None:
+        if (
+            httpx is None
+            or getattr(settings, "HOOK_OUTBOX", False)
+            or getattr(settings, "HOOK_SPOOL_DIR", None)
+        ):
+            client = SyncClientAdapter(get_client())
+        else:
+            client = AsyncClient()
+        __CLIENTS[loop] = client
+    return client
+
+
+class Unlimited(object):
+    """Async context manager that does nothing, `nullcontext` only supports `async with` on 3.10+."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class SyncClientAdapter(object):
+    """Hands deliveries to a synchronous client, in a thread."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def batch(self):
+        return nullcontext()
+
+    async def post(self, *args, **kwargs):
+        await sync_to_async(self.client.post, thread_sensitive=False)(*args, **kwargs)
+
+    async def drain(self):
+        pass
+
+
+class AsyncClient(object):
+    """
+    Delivers hooks from the event loop with httpx, reusing connections. Every
+    delivery runs in its own task, so `post` returns right away, and at most
+    `max_per_host` deliveries to the same host are in flight at once (see
+    settings.HOOK_MAX_PER_HOST). Failed deliveries are retried by the task
+    according to the `DeliveryPolicy`.
+    """
+
+    def __init__(self, max_per_host=None, timeout=None, policy=None, http=None):
+        if httpx is None:
+            raise ImproperlyConfigured("AsyncClient requires the httpx package")
+        if max_per_host is None:
+            max_per_host = getattr(settings, "HOOK_MAX_PER_HOST", 2)
+        if http is None:
+            timeout = timeout or get_timeout()
+            if isinstance(timeout, (tuple, list)):
+                timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+            limits = httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=getattr(settings, "HOOK_POOL_MAXSIZE", 10),
+            )
+            http = httpx.AsyncClient(timeout=timeout, limits=limits)
+        self.http = http
+        self.max_per_host = max_per_host
+        self.policy = policy or DeliveryPolicy.from_settings()
+        self.semaphores = {}
+        self.tasks = set()
+
+    def batch(self):
+        return nullcontext()
+
+    def get_semaphore(self, host):
+        if not self.max_per_host:
+            return Unlimited()
+        semaphore = self.semaphores.get(host)
+        if semaphore is None:
+            semaphore = self.semaphores[host] = asyncio.BoundedSemaphore(self.max_per_host)
+        return semaphore
+
+    async def post(self, url, data=b"", headers=None, hook_id=None):
+        """Starts delivering, returns the task doing it."""
+        task = asyncio.get_running_loop().create_task(self.deliver(url, data, headers, hook_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def send(self, url, data, headers, hook_id, attempt):
+        """
+        Attempts a delivery, returns the policy outcome (or None if it wasn't
+        attempted) and the delay before it may be attempted again.
+        """
+        host = urlsplit(url).netloc
+        if not self.policy.allow(host):
+            # held back by the circuit of the host, which doesn't count as an attempt
+            return None, self.policy.breaker.retry_after(host)
+        async with self.get_semaphore(host):
+            try:
+                with get_metrics().timer("drf_hooks_deliver_seconds", host=host):
+                    response = await self.http.post(url, content=data, headers=headers)
+            except httpx.HTTPError as e:
+                outcome = self.policy.outcome(hook_id, host, attempt, exception=e)
+                return outcome, self.policy.get_delay(attempt)
+        outcome = self.policy.outcome(hook_id, host, attempt, response=response)
+        return outcome, self.policy.get_delay(attempt, response)
+
+    async def deliver(self, url, data, headers, hook_id):
+        attempt = 0
+        while True:
+            outcome, delay = await self.send(url, data, headers, hook_id, attempt)
+            if outcome is not None and outcome != RETRY:
+                return outcome
+            await asyncio.sleep(delay)
+            if outcome == RETRY:
+                attempt += 1
+
+    async def drain(self):
+        """Waits for the deliveries in flight, including their retries."""
+        while self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def aclose(self):
+        await self.drain()
+        await self.http.aclose()
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class DRFHooksConfig(AppConfig):
+    name = "drf_hooks"
+    default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        from .models import compile_dispatch_table
+
+        compile_dispatch_table()
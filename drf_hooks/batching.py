@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from .client import get_client
+from .encoders import compress, get_payload_encoder
+
+logger = logging.getLogger(__name__)
+
+__BATCHER = None
+
+
+def get_batcher():
+    global __BATCHER
+    if __BATCHER is None:
+        __BATCHER = Batcher()
+    return __BATCHER
+
+
+def clear_batcher():
+    global __BATCHER
+    flush_batcher()
+    __BATCHER = None
+
+
+def flush_batcher():
+    """Delivers the pending batches, if any."""
+    if __BATCHER is not None:
+        __BATCHER.flush_all()
+
+
+def discard_batcher():
+    """Forgets the batcher without delivering its batches, which belong to the parent process."""
+    global __BATCHER
+    __BATCHER = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=discard_batcher)
+
+
+class PendingBatch(object):
+    __slots__ = ("target", "headers", "content_encoding", "bodies", "timer")
+
+    def __init__(self, target, headers, content_encoding=""):
+        self.target = target
+        self.headers = headers
+        self.content_encoding = content_encoding
+        self.bodies = []
+        self.timer = None
+
+
+class Batcher(object):
+    """
+    Accumulates the bodies of hooks with a `batch_size` above 1 and delivers
+    them as a single JSON array, compressed with the `content_encoding` of the
+    hook if any, once `batch_size` bodies are pending or
+    `batch_interval` milliseconds after the first one, whichever comes first.
+    With a `batch_interval` of 0, the pending bodies are delivered at the end of
+    the current `batch` block instead, e.g. once all the events of a bulk
+    operation have been added.
+
+    The timers are not daemon threads, so pending batches are still delivered
+    when the interpreter exits normally.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        depth = getattr(self.local, "depth", 0)
+        self.local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self.local.depth = depth
+            if not depth:
+                self.flush_unscheduled()
+
+    def add(self, hook, body):
+        """Adds the serialized `body` of `hook`, delivering its batch if it is full."""
+        with self.lock:
+            batch = self.pending.get(hook.pk)
+            if batch is None:
+                batch = self.pending[hook.pk] = PendingBatch(
+                    hook.target, hook.get_delivery_headers(), hook.content_encoding
+                )
+            batch.bodies.append(body)
+            if len(batch.bodies) >= hook.batch_size:
+                del self.pending[hook.pk]
+                if batch.timer is not None:
+                    batch.timer.cancel()
+            else:
+                if hook.batch_interval and batch.timer is None:
+                    batch.timer = threading.Timer(
+                        hook.batch_interval / 1000.0, self.flush_due, args=(hook.pk,)
+                    )
+                    batch.timer.start()
+                batch = None
+        if batch is not None:
+            self.deliver(hook.pk, batch)
+        elif not getattr(self.local, "depth", 0):
+            # not within a batch block, nothing else is coming
+            self.flush_unscheduled()
+
+    def flush(self, hook_id):
+        with self.lock:
+            batch = self.pending.pop(hook_id, None)
+        if batch is not None:
+            self.deliver(hook_id, batch)
+
+    def flush_due(self, hook_id):
+        try:
+            self.flush(hook_id)
+        except Exception:
+            logger.exception("Failed to deliver a batch of hooks")
+
+    def flush_unscheduled(self):
+        """Delivers the pending batches without a timer."""
+        with self.lock:
+            hook_ids = [hook_id for hook_id, batch in self.pending.items() if batch.timer is None]
+        for hook_id in hook_ids:
+            self.flush(hook_id)
+
+    def flush_all(self):
+        """Delivers all the pending batches right away."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for hook_id, batch in pending.items():
+            if batch.timer is not None:
+                batch.timer.cancel()
+            self.deliver(hook_id, batch)
+
+    def deliver(self, hook_id, batch):
+        data = get_payload_encoder().join(batch.bodies)
+        if batch.content_encoding:
+            data = compress((data,), batch.content_encoding)
+        get_client().post(url=batch.target, data=data, headers=batch.headers, hook_id=hook_id)
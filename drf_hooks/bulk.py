@@ -0,0 +1,154 @@
+from functools import partial
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, router, transaction
+
+from .deferred import is_deferred
+from .models import (
+    filter_changed_fields,
+    get_event_lookup,
+    get_event_options,
+    get_hook_model,
+    suppress_hooks,
+)
+
+
+def fire_bulk(model, instances, action, using=None, fields=None):
+    """
+    Fires the hooks for an `action` on many instances of `model` at once:
+    the instances are serialized in one pass, the subscribers of all their
+    users are found with a single query and the deliveries are enqueued as one
+    batch. Use it after bulk operations which don't send signals. The payloads
+    are restricted to `fields` if given.
+    """
+    hook_model = get_hook_model()
+    instances = list(instances)
+    using = using or router.db_for_write(model)
+    if not is_deferred(using):
+        hook_model.handle_bulk_model_event(model, instances, action, fields)
+    elif action == "deleted":
+        # the rows are gone by the time we commit, so serialize them right away
+        deliveries = hook_model.find_bulk_deliveries(model, instances, action, fields)
+        transaction.on_commit(partial(hook_model.deliver_bulk, deliveries), using=using)
+    else:
+        handle = partial(hook_model.handle_bulk_model_event, model, instances, action, fields)
+        transaction.on_commit(handle, using=using)
+
+
+def get_event_model(event_name):
+    """Returns the model and action of a model event of settings.HOOK_EVENTS."""
+    for label, actions in get_event_lookup().items():
+        for action, (name, _) in actions.items():
+            if name == event_name:
+                return apps.get_model(label), action
+    raise ValueError("%s is not a model event of settings.HOOK_EVENTS" % event_name)
+
+
+def backfill(event_name, queryset=None, hooks=None, chunk_size=1000, after=None):
+    """
+    Fires `event_name` for the existing rows of its model (or of `queryset`),
+    e.g. to send the current state of all objects to a new subscriber. Rows
+    are read in primary key order by chunks of `chunk_size`, so memory use
+    doesn't depend on the number of rows and no cursor is held open in
+    between, and each chunk is delivered with `fire_bulk`'s single pass.
+    `hooks` narrows down the subscribers, by default all the hooks of the
+    event. Starts after the primary key `after` if given, and yields the last
+    primary key, the number of rows and of deliveries of every chunk.
+    """
+    hook_model = get_hook_model()
+    model, action = get_event_model(event_name)
+    if action == "deleted":
+        raise ValueError("Only events of existing rows can be backfilled")
+    if queryset is None:
+        queryset = hook_model.get_serialization_queryset(model)
+    queryset = queryset.order_by("pk")
+    while True:
+        chunk = queryset if after is None else queryset.filter(pk__gt=after)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        deliveries = hook_model.find_bulk_deliveries(model, chunk, action, hooks=hooks)
+        hook_model.deliver_bulk(deliveries)
+        after = chunk[-1].pk
+        yield after, len(chunk), len(deliveries)
+        if len(chunk) < chunk_size:
+            return
+
+
+def has_user_field(model):
+    """Whether the owner of `model` instances is a `user` foreign key, see `get_user_id`."""
+    try:
+        return model._meta.get_field("user").attname == "user_id"
+    except FieldDoesNotExist:
+        return False
+
+
+class HookQuerySetMixin(object):
+    """
+    Makes `bulk_create`, `update` and `delete` fire the "created", "updated"
+    and "deleted" hooks of the model with `fire_bulk`, instead of skipping them
+    (`bulk_create`, `update`) or firing them one row at a time (`delete`).
+
+    `bulk_create` can only fire hooks with primary keys on databases which
+    return them, and `update` fetches the updated rows back in chunks of
+    `hook_chunk_size`, if they have subscribers.
+    """
+
+    hook_chunk_size = 1000
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        fire_bulk(self.model, objs, "created", using=self.db)
+        return objs
+
+    def update(self, **kwargs):
+        events = get_event_lookup().get(self.model._meta.label, {})
+        if "updated" not in events:
+            return super().update(**kwargs)
+        event_name, all_users = events["updated"]
+        changed = filter_changed_fields(self.model, kwargs)
+        if changed is not None and not changed:
+            # none of the watched fields are updated
+            return super().update(**kwargs)
+        hooks = get_hook_model().find_hooks(event_name)
+        if not hooks.exists():
+            return super().update(**kwargs)
+        fields = None
+        if changed is not None and get_event_options(event_name).delta:
+            fields = changed
+        if all_users or not has_user_field(self.model):
+            pks = list(self.values_list("pk", flat=True))
+        else:
+            # only the rows of users with hooks are fetched back
+            user_ids = set(hooks.values_list("user_id", flat=True).distinct())
+            pks = [pk for pk, user_id in self.values_list("pk", "user_id") if user_id in user_ids]
+        rows = super().update(**kwargs)
+        manager = self.model._base_manager.using(self.db)
+        for start in range(0, len(pks), self.hook_chunk_size):
+            chunk = manager.filter(pk__in=pks[start : start + self.hook_chunk_size])
+            fire_bulk(self.model, chunk, "updated", using=self.db, fields=fields)
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        hook_model = get_hook_model()
+        deliveries = hook_model.find_bulk_deliveries(self.model, list(self), "deleted")
+        with suppress_hooks(self.model):
+            result = super().delete()
+        if is_deferred(self.db):
+            transaction.on_commit(partial(hook_model.deliver_bulk, deliveries), using=self.db)
+        else:
+            hook_model.deliver_bulk(deliveries)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class HookQuerySet(HookQuerySetMixin, models.QuerySet):
+    pass
+
+
+HookManager = models.Manager.from_queryset(HookQuerySet)
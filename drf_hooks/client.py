@@ -1,8 +1,28 @@
+import atexit
 import collections
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import signal
+import tempfile
 import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
 
 import requests
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from requests.adapters import HTTPAdapter
+
+from .metrics import get_metrics
+from .retry import RETRY, RETRY_STATUS_CODES, DeliveryPolicy
+
+logger = logging.getLogger(__name__)
 
 __CLIENT = None
 
@@ -10,13 +30,478 @@ __CLIENT = None
 def get_client():
     global __CLIENT
     if __CLIENT is None:
-        __CLIENT = Client() if getattr(settings, "HOOK_THREADING", True) else requests.Session()
+        if getattr(settings, "HOOK_OUTBOX", False):
+            from .outbox import OutboxClient
+
+            __CLIENT = OutboxClient()
+        elif getattr(settings, "HOOK_SPOOL_DIR", None):
+            from .spool import SpoolClient
+
+            __CLIENT = SpoolClient(settings.HOOK_SPOOL_DIR)
+        elif getattr(settings, "HOOK_THREADING", True):
+            __CLIENT = Client(num_threads=getattr(settings, "HOOK_THREADS", 3))
+            if (
+                getattr(settings, "HOOK_DRAIN_ON_SIGTERM", False)
+                and threading.current_thread() is threading.main_thread()
+            ):
+                install_sigterm_handler()
+        else:
+            __CLIENT = SyncClient()
     return __CLIENT
 
 
+def clear_client():
+    """Forgets the client, e.g. in a child process, which can't use the threads of its parent."""
+    global __CLIENT
+    __CLIENT = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=clear_client)
+
+
+def drain(timeout=None):
+    """
+    Delivers the pending batches and waits up to `timeout` seconds (by
+    default settings.HOOK_DRAIN_TIMEOUT, 10) for the deliveries queued by
+    this process. Returns the number of deliveries left undelivered. Called
+    when the interpreter exits, and on SIGTERM with settings.HOOK_DRAIN_ON_SIGTERM.
+    """
+    from .batching import flush_batcher
+
+    flush_batcher()
+    client = __CLIENT
+    if not hasattr(client, "drain"):
+        return 0
+    if timeout is None:
+        timeout = getattr(settings, "HOOK_DRAIN_TIMEOUT", 10)
+    if client.drain(timeout):
+        return 0
+    undelivered = client.undelivered
+    logger.warning("%d hook deliveries were left undelivered", undelivered)
+    return undelivered
+
+
+atexit.register(drain)
+
+
+def install_sigterm_handler():
+    """
+    Drains the client when the process receives SIGTERM, then hands the signal
+    to the previous handler. Only possible from the main thread.
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handler(signum, frame):
+        # the signal may have interrupted the main thread while it held a lock
+        # drain needs, so drain in another thread and give up after the timeout
+        timeout = getattr(settings, "HOOK_DRAIN_TIMEOUT", 10)
+        thread = threading.Thread(target=drain, args=(timeout,), daemon=True)
+        thread.start()
+        thread.join(timeout)
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    signal.signal(signal.SIGTERM, handler)
+
+
+def get_timeout():
+    """(connect, read) timeout in seconds for delivering hooks, from settings.HOOK_TIMEOUT."""
+    return getattr(settings, "HOOK_TIMEOUT", (5, 30))
+
+
+def build_session():
+    """
+    Returns a session which keeps a pool of connections per target host, configured
+    with settings.HOOK_POOL_CONNECTIONS (number of hosts to keep pools for),
+    settings.HOOK_POOL_MAXSIZE (connections kept per host) and settings.HOOK_KEEP_ALIVE.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=getattr(settings, "HOOK_POOL_CONNECTIONS", 10),
+        pool_maxsize=getattr(settings, "HOOK_POOL_MAXSIZE", 10),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not getattr(settings, "HOOK_KEEP_ALIVE", True):
+        session.headers["Connection"] = "close"
+    # the session is shared by all targets, don't let them set cookies for each other
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+class SyncClient(object):
+    """
+    Sends requests right away, reusing connections. Used when HOOK_THREADING is False.
+    """
+
+    def __init__(self, session=None, timeout=None, policy=None):
+        self.session = session or build_session()
+        self.timeout = timeout or get_timeout()
+        self.policy = policy or DeliveryPolicy.from_settings()
+
+    def batch(self):
+        return nullcontext()
+
+    def request(self, method, *args, hook_id=None, **kwargs):
+        """
+        Sends the request and returns the response. Failed requests are not
+        retried, as that would hold up the caller.
+        """
+        host = urlsplit(kwargs.get("url") or args[0]).netloc
+        if not self.policy.allow(host):
+            logger.warning("Skipped delivery to %s, too many failures", host)
+            return None
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            with get_metrics().timer("drf_hooks_deliver_seconds", host=host):
+                response = getattr(self.session, method)(*args, **kwargs)
+        except requests.RequestException as e:
+            self.policy.outcome(hook_id, host, self.policy.max_retries, exception=e)
+            raise
+        self.policy.outcome(hook_id, host, self.policy.max_retries, response=response)
+        return response
+
+    def get(self, *args, **kwargs):
+        return self.request("get", *args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self.request("post", *args, **kwargs)
+
+    def put(self, *args, **kwargs):
+        return self.request("put", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self.request("delete", *args, **kwargs)
+
+
+class SpillFile(object):
+    """
+    Segment files on local disk holding the deliveries that didn't fit in the
+    queue. Segments are replayed, oldest first, one delivery at a time.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or tempfile.gettempdir()
+        self.segments = collections.deque()
+        self.writer = None
+        self.reader = None
+        self.count = 0
+        self.serial = 0
+
+    def write(self, item):
+        if self.writer is None:
+            self.serial += 1
+            name = "drf-hooks-%d-%d-%d.spill" % (os.getpid(), id(self), self.serial)
+            path = os.path.join(self.directory, name)
+            self.writer = (path, open(path, "wb"))
+        pickle.dump(item, self.writer[1], protocol=pickle.HIGHEST_PROTOCOL)
+        self.count += 1
+
+    def rotate(self):
+        path, f = self.writer
+        f.close()
+        self.segments.append(path)
+        self.writer = None
+
+    def read(self):
+        """Returns the oldest spilled delivery, or None."""
+        while self.count:
+            if self.reader is None:
+                if not self.segments:
+                    self.rotate()
+                path = self.segments.popleft()
+                self.reader = (path, open(path, "rb"))
+            path, f = self.reader
+            try:
+                item = pickle.load(f)
+            except EOFError:
+                f.close()
+                os.remove(path)
+                self.reader = None
+                continue
+            self.count -= 1
+            if not self.count:
+                f.close()
+                os.remove(path)
+                self.reader = None
+            return item
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limits the deliveries in flight per target host, adapting the limit to how
+    the host copes (AIMD): every delivery answered within `target_latency`
+    seconds adds 1/limit to it, so it grows by about one per round trip, while a
+    transport error, a 408/429/5xx or a slow answer halves it. Decreases happen
+    at most once per `target_latency`, so a burst of failures counts once.
+    """
+
+    def __init__(self, initial=2, min_limit=1, max_limit=32, target_latency=1.0):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.limits = {}
+        self.decreased = {}
+        self.lock = threading.Lock()
+
+    def get_limit(self, host):
+        return int(self.limits.get(host, self.initial))
+
+    def record(self, host, latency, ok):
+        with self.lock:
+            limit = self.limits.get(host, self.initial)
+            if ok and latency <= self.target_latency:
+                self.limits[host] = min(self.max_limit, limit + 1.0 / limit)
+                return
+            now = time.monotonic()
+            if now - self.decreased.get(host, -self.target_latency) < self.target_latency:
+                return
+            self.decreased[host] = now
+            self.limits[host] = max(self.min_limit, limit / 2.0)
+
+
+class DeliveryQueue(object):
+    """
+    Queue of deliveries, with one FIFO queue per target host. Hosts are served
+    round-robin, `weights` deliveries at a time (1 by default), and at most
+    `max_per_host` deliveries to the same host are in flight at once, so a slow
+    target can't keep all the flush threads to itself.
+
+    The queue is optionally bounded by a number of deliveries (`max_size`) and/or
+    by the size of their payloads (`max_bytes`). When it is full, the `overflow`
+    policy decides what happens to new deliveries:
+
+    - "block": wait up to `block_timeout` seconds for room, then drop it
+    - "drop_oldest": drop the oldest delivery of the most backed up host
+    - "drop_newest": drop the new delivery
+    - "spill": write it to a segment file in `spill_dir`, which is replayed
+      once the queue drains
+
+    If a `limiter` such as `AdaptiveConcurrency` is given, it decides how many
+    deliveries may be in flight per host instead of `max_per_host`.
+
+    Deliveries can be `debounce`d: they wait for the end of a window, during
+    which newer deliveries with the same key replace them.
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest", "spill")
+
+    def __init__(
+        self,
+        max_size=None,
+        max_bytes=None,
+        overflow="block",
+        block_timeout=5,
+        spill_dir=None,
+        max_per_host=None,
+        weights=None,
+        limiter=None,
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ImproperlyConfigured("Unknown hook queue overflow policy '%s'" % overflow)
+        self.hosts = {}
+        self.ring = collections.deque()
+        self.credits = {}
+        self.in_flight = collections.Counter()
+        self.count = 0
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.spill = SpillFile(spill_dir) if overflow == "spill" else None
+        self.max_per_host = max_per_host
+        self.weights = weights or {}
+        self.limiter = limiter
+        self.delayed = []
+        self.debounced = {}
+        self.sequence = itertools.count()
+        self.size_bytes = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.not_full = threading.Condition()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_size=getattr(settings, "HOOK_QUEUE_MAX_SIZE", None),
+            max_bytes=getattr(settings, "HOOK_QUEUE_MAX_BYTES", None),
+            overflow=getattr(settings, "HOOK_QUEUE_OVERFLOW", "block"),
+            block_timeout=getattr(settings, "HOOK_QUEUE_BLOCK_TIMEOUT", 5),
+            spill_dir=getattr(settings, "HOOK_QUEUE_SPILL_DIR", None),
+            max_per_host=getattr(settings, "HOOK_MAX_PER_HOST", 2),
+            weights=getattr(settings, "HOOK_HOST_WEIGHTS", None),
+        )
+
+    def __len__(self):
+        return self.count + len(self.delayed) + (self.spill.count if self.spill else 0)
+
+    @staticmethod
+    def get_size(item):
+        data = item[2].get("data")
+        return len(data) if isinstance(data, (bytes, str)) else 0
+
+    @staticmethod
+    def get_host(item):
+        return urlsplit(item[2].get("url") or item[1][0]).netloc
+
+    def is_full(self, size=0):
+        if self.max_size is not None and self.count >= self.max_size:
+            return True
+        if self.max_bytes is not None and self.count:
+            return self.size_bytes + size > self.max_bytes
+        return False
+
+    def append(self, item, size):
+        host = self.get_host(item)
+        if host not in self.hosts:
+            self.hosts[host] = collections.deque()
+            self.ring.append(host)
+        self.hosts[host].append(item)
+        self.count += 1
+        self.size_bytes += size
+
+    def drop_oldest(self):
+        host = max(self.hosts, key=lambda host: len(self.hosts[host]))
+        self.pop(host)
+        self.dropped += 1
+
+    def pop(self, host):
+        items = self.hosts[host]
+        item = items.popleft()
+        if not items:
+            del self.hosts[host]
+            self.ring.remove(host)
+            self.credits.pop(host, None)
+        self.count -= 1
+        self.size_bytes -= self.get_size(item)
+        return item
+
+    def put(self, item):
+        """Queues a delivery, returns False if it had to be dropped."""
+        size = self.get_size(item)
+        with self.not_full:
+            if self.spill is not None and self.spill.count:
+                # keep the spilled deliveries ahead of the new ones
+                self.spill.write(item)
+                self.spilled += 1
+                return True
+            if self.is_full(size):
+                if self.overflow == "block":
+                    if not self.not_full.wait_for(
+                        lambda: not self.is_full(size), timeout=self.block_timeout
+                    ):
+                        self.dropped += 1
+                        return False
+                elif self.overflow == "drop_oldest":
+                    while self.count and self.is_full(size):
+                        self.drop_oldest()
+                elif self.overflow == "drop_newest":
+                    self.dropped += 1
+                    return False
+                else:
+                    self.spill.write(item)
+                    self.spilled += 1
+                    return True
+            self.append(item, size)
+            return True
+
+    def clear(self):
+        """Discards all the queued deliveries, returns how many there were."""
+        with self.not_full:
+            count = len(self)
+            self.hosts.clear()
+            self.ring.clear()
+            self.credits.clear()
+            self.delayed = []
+            self.debounced.clear()
+            self.count = 0
+            self.size_bytes = 0
+            if self.spill is not None:
+                while self.spill.read() is not None:
+                    pass
+            self.not_full.notify_all()
+            return count
+
+    def schedule(self, item, delay):
+        """Queues a delivery to be retried in `delay` seconds, regardless of the bounds."""
+        with self.not_full:
+            due = time.monotonic() + delay
+            heapq.heappush(self.delayed, (due, next(self.sequence), item, None))
+
+    def debounce(self, key, item, delay):
+        """
+        Queues a delivery to be sent in `delay` seconds, unless a delivery with
+        the same `key` is already waiting, in which case it takes its place.
+        Returns the delivery it replaced, if any.
+        """
+        with self.not_full:
+            replaced = self.debounced.get(key)
+            self.debounced[key] = item
+            if replaced is None:
+                due = time.monotonic() + delay
+                heapq.heappush(self.delayed, (due, next(self.sequence), None, key))
+            return replaced
+
+    def next_due(self):
+        """Monotonic time at which the next scheduled retry is due, if any."""
+        with self.not_full:
+            return self.delayed[0][0] if self.delayed else None
+
+    def get(self):
+        """
+        Returns the next delivery, or None if there is none which can be sent
+        right now. Must be followed by `task_done` once it has been sent.
+        """
+        with self.not_full:
+            now = time.monotonic()
+            while self.delayed and self.delayed[0][0] <= now:
+                due, sequence, item, key = heapq.heappop(self.delayed)
+                if key is not None:
+                    item = self.debounced.pop(key)
+                self.append(item, self.get_size(item))
+            if not self.count and self.spill is not None:
+                item = self.spill.read()
+                if item is not None:
+                    self.append(item, self.get_size(item))
+            for _ in range(len(self.ring)):
+                host = self.ring[0]
+                if self.limiter is not None:
+                    limit = self.limiter.get_limit(host)
+                else:
+                    limit = self.max_per_host
+                if limit is not None and self.in_flight[host] >= limit:
+                    self.ring.rotate(-1)
+                    continue
+                credits = self.credits.get(host) or self.weights.get(host, 1)
+                if credits > 1:
+                    self.credits[host] = credits - 1
+                else:
+                    # the next host's turn
+                    self.credits.pop(host, None)
+                    self.ring.rotate(-1)
+                self.in_flight[host] += 1
+                item = self.pop(host)
+                self.not_full.notify()
+                return item
+            return None
+
+    def task_done(self, item):
+        host = self.get_host(item)
+        with self.not_full:
+            self.in_flight[host] -= 1
+            if not self.in_flight[host]:
+                del self.in_flight[host]
+
+
 class FlushThread(threading.Thread):
     def __init__(self, client):
-        threading.Thread.__init__(self)
+        # daemon threads, so that exiting waits for `drain` rather than for the whole queue
+        threading.Thread.__init__(self, daemon=True)
         self.client = client
 
     def run(self):
@@ -26,19 +511,79 @@ class FlushThread(threading.Thread):
 class Client(object):
     """
     Manages a simple pool of threads to flush the queue of requests.
+    The threads share a long-lived session, so connections to the targets are
+    reused even though the threads stop whenever the queue is empty.
     """
 
-    def __init__(self, num_threads=3):
-        self.queue = collections.deque()
+    def __init__(self, num_threads=3, session=None, timeout=None, queue=None, policy=None):
+        self.queue = queue if queue is not None else DeliveryQueue.from_settings()
+        self.session = session or build_session()
+        self.timeout = timeout or get_timeout()
+        self.policy = policy or DeliveryPolicy.from_settings()
+        self.wakeup = None
+        self.wakeup_due = None
 
         self.flush_lock = threading.Lock()
         self.num_threads = num_threads
         self.flush_threads = [FlushThread(self) for _ in range(self.num_threads)]
         self.total_sent = 0
+        self.local = threading.local()
+        self.deferred = collections.deque()
+        self.deferred_thread = None
+
+    @contextmanager
+    def batch(self):
+        """Enqueues many requests at once, only refreshing the threads at the end."""
+        batching = getattr(self.local, "batching", False)
+        self.local.batching = True
+        try:
+            yield
+        finally:
+            self.local.batching = batching
+            if not batching:
+                self.refresh_threads()
+
+    @property
+    def queue_depth(self):
+        return len(self.queue)
+
+    @property
+    def queued_bytes(self):
+        return self.queue.size_bytes
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+    @property
+    def spilled(self):
+        return self.queue.spilled
 
     def enqueue(self, method, *args, **kwargs):
-        self.queue.append((method, args, kwargs))
-        self.refresh_threads()
+        metrics = get_metrics()
+        item = (method, args, kwargs, 0)
+        with metrics.timer("drf_hooks_enqueue_seconds"):
+            if self.queue.is_full(self.queue.get_size(item)):
+                # make sure somebody is making room
+                self.refresh_threads()
+            if not self.queue.put(item):
+                metrics.increment("drf_hooks_dropped_total")
+                logger.warning("Hook queue is full, dropped delivery to %s", kwargs.get("url"))
+        metrics.gauge("drf_hooks_queue_depth", len(self.queue))
+        if not getattr(self.local, "batching", False):
+            self.refresh_threads()
+
+    def debounce(self, key, delay, **kwargs):
+        """Posts in `delay` seconds, replacing the delivery waiting under `key` if any."""
+        self.enqueue_debounced(key, delay, ("post", (), kwargs, 0))
+
+    def enqueue_debounced(self, key, delay, item):
+        replaced = self.queue.debounce(key, item, delay)
+        if replaced is None:
+            self.schedule_wakeup()
+        else:
+            get_metrics().increment("drf_hooks_debounced_total")
+            self.finish(replaced, None)
 
     def get(self, *args, **kwargs):
         self.enqueue("get", *args, **kwargs)
@@ -52,6 +597,61 @@ class Client(object):
     def delete(self, *args, **kwargs):
         self.enqueue("delete", *args, **kwargs)
 
+    def defer_fan_out(self, event_name, encoded_payload, debounce_key=None):
+        """
+        Looks up the hooks of `event_name` and delivers `encoded_payload` to
+        them in a separate thread, see `AbstractHook.find_and_fire_hooks`.
+        """
+        self.defer("fan_out", event_name, encoded_payload, debounce_key)
+
+    def defer_events(self, refs):
+        """Serializes and delivers model events in a separate thread, see `EventRef`."""
+        self.defer("fire_deferred_events", refs)
+
+    def defer(self, method, *args):
+        """Calls `method` of the hook model with `args` in the deferred thread."""
+        with self.flush_lock:
+            self.deferred.append((method, args))
+            if self.deferred_thread is None:
+                self.deferred_thread = threading.Thread(target=self.run_deferred, daemon=True)
+                self.deferred_thread.start()
+
+    def run_deferred(self):
+        from .models import get_hook_model
+
+        try:
+            while True:
+                with self.flush_lock:
+                    if not self.deferred:
+                        self.deferred_thread = None
+                        return
+                    method, args = self.deferred.popleft()
+                try:
+                    getattr(get_hook_model(), method)(*args)
+                except Exception:
+                    logger.exception("Failed to fire deferred hooks (%s)", method)
+        finally:
+            connections.close_all()
+
+    @property
+    def undelivered(self):
+        """Deliveries queued, scheduled for a retry, in flight or still to be fanned out."""
+        with self.queue.not_full:
+            in_flight = sum(self.queue.in_flight.values())
+        with self.flush_lock:
+            deferred = len(self.deferred) + (self.deferred_thread is not None)
+        return len(self.queue) + in_flight + deferred
+
+    def drain(self, timeout=None):
+        """Waits up to `timeout` seconds for the deliveries, returns False if some are left."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.refresh_threads()
+        while self.undelivered:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
     def refresh_threads(self):
         with self.flush_lock:
             # refresh if there are jobs to do and no threads are alive
@@ -65,9 +665,72 @@ class Client(object):
                     self.flush_threads[index] = FlushThread(self)
                     self.flush_threads[index].start()
 
+    def schedule_wakeup(self):
+        """Makes sure the threads are started when the next retry is due."""
+        due = self.queue.next_due()
+        if due is None:
+            return
+        with self.flush_lock:
+            if self.wakeup is not None and self.wakeup.is_alive() and self.wakeup_due <= due:
+                return
+            if self.wakeup is not None:
+                self.wakeup.cancel()
+            self.wakeup = threading.Timer(max(0, due - time.monotonic()), self.refresh_threads)
+            self.wakeup.daemon = True
+            self.wakeup_due = due
+            self.wakeup.start()
+
+    def send(self, item):
+        """
+        Attempts a delivery, returns the policy outcome (or None if it wasn't
+        attempted) and the delay before it may be attempted again.
+        """
+        method, args, kwargs, attempt = item
+        kwargs = dict(kwargs, timeout=kwargs.get("timeout", self.timeout))
+        hook_id = kwargs.pop("hook_id", None)
+        host = self.queue.get_host(item)
+        if not self.policy.allow(host):
+            # held back by the circuit of the host, which doesn't count as an attempt
+            return None, self.policy.breaker.retry_after(host)
+        started = time.perf_counter()
+        try:
+            with get_metrics().timer("drf_hooks_deliver_seconds", host=host):
+                response = getattr(self.session, method)(*args, **kwargs)
+        except requests.RequestException as e:
+            self.record(host, time.perf_counter() - started, ok=False)
+            outcome = self.policy.outcome(hook_id, host, attempt, exception=e)
+            return outcome, self.policy.get_delay(attempt)
+        ok = response.status_code not in RETRY_STATUS_CODES
+        self.record(host, time.perf_counter() - started, ok=ok)
+        outcome = self.policy.outcome(hook_id, host, attempt, response=response)
+        return outcome, self.policy.get_delay(attempt, response)
+
+    def record(self, host, latency, ok):
+        if self.queue.limiter is not None:
+            self.queue.limiter.record(host, latency, ok)
+
+    def finish(self, item, outcome):
+        """
+        Called once a delivery is done with, whether it succeeded or not, with
+        no outcome if it was replaced by a newer delivery (see `debounce`).
+        """
+
     def sync_flush(self):
-        session = requests.Session()
-        while self.queue:
-            method, args, kwargs = self.queue.pop()
-            getattr(session, method)(*args, **kwargs)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.schedule_wakeup()
+                return
+            try:
+                outcome, delay = self.send(item)
+                if outcome is None:
+                    self.queue.schedule(item, delay)
+                elif outcome == RETRY:
+                    method, args, kwargs, attempt = item
+                    self.queue.schedule((method, args, kwargs, attempt + 1), delay)
+                else:
+                    self.finish(item, outcome)
+            finally:
+                self.queue.task_done(item)
             self.total_sent += 1
+            get_metrics().gauge("drf_hooks_queue_depth", len(self.queue))
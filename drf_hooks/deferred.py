@@ -0,0 +1,214 @@
+import threading
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .client import get_client
+
+_local = threading.local()
+
+# what the client needs to serialize a model event itself, see `defers_serialization`
+# and the database it was saved to, refs written by older versions have none
+EventRef = namedtuple("EventRef", ["model", "pk", "action", "fields", "using"], defaults=[None])
+
+
+def defers_serialization():
+    """
+    Whether model events are serialized by the client rather than by the
+    caller, see settings.HOOK_DEFER_SERIALIZATION.
+    """
+    if not getattr(settings, "HOOK_DEFER_SERIALIZATION", False):
+        return False
+    return hasattr(get_client(), "defer_events")
+
+
+def is_deferred(using):
+    """Whether events should wait for the current transaction on `using` to commit."""
+    if not getattr(settings, "HOOK_DEFER_UNTIL_COMMIT", False) and not defers_serialization():
+        return False
+    return connections[using].in_atomic_block
+
+
+def get_event_buffer(using):
+    """
+    Returns the event buffer of the current transaction or savepoint on
+    `using`. Each savepoint gets its own buffer, fired on commit like any
+    `transaction.on_commit` callback registered within it, so rolling back to
+    a savepoint discards the events recorded since.
+    """
+    all_buffers = getattr(_local, "buffers", None)
+    if all_buffers is None:
+        all_buffers = _local.buffers = {}
+    buffers = all_buffers.get(using)
+    if buffers is None:
+        buffers = all_buffers[using] = []
+    buffers[:] = [buffer for buffer in buffers if buffer.is_pending()]
+    # blocks with savepoint=False are listed as None, they can't be rolled back on their own
+    savepoints = tuple(sid for sid in connections[using].savepoint_ids if sid is not None)
+    for buffer in buffers:
+        if buffer.savepoints == savepoints:
+            return buffer
+    buffer = EventBuffer(using, savepoints, buffers)
+    buffers.append(buffer)
+    transaction.on_commit(buffer.flush, using=using)
+    return buffer
+
+
+class DeferredEvent(object):
+    __slots__ = (
+        "hook_model",
+        "event_name",
+        "instance",
+        "all_users",
+        "payload",
+        "user",
+        "fields",
+        "action",
+    )
+
+    def __init__(
+        self,
+        hook_model,
+        event_name,
+        instance=None,
+        all_users=False,
+        payload=None,
+        user=None,
+        fields=None,
+        action=None,
+    ):
+        self.hook_model = hook_model
+        self.event_name = event_name
+        self.instance = instance
+        self.all_users = all_users
+        self.payload = payload
+        self.user = user
+        self.fields = fields
+        self.action = action
+
+    def ref(self):
+        """Returns an `EventRef`, or None if the event has to be serialized right away."""
+        if self.instance is None or self.instance.pk is None:
+            return None
+        fields = None if self.fields is None else frozenset(self.fields)
+        return EventRef(
+            self.instance._meta.label,
+            self.instance.pk,
+            self.action,
+            fields,
+            self.instance._state.db,
+        )
+
+    def fire(self):
+        debounce_key = None
+        if self.instance is None:
+            payload, user = self.payload, self.user
+        else:
+            debounce_key = (self.instance._meta.label, self.instance.pk)
+            # serialized now, so that it reflects the state at commit time
+            if self.fields is None:
+                payload = partial(self.hook_model.serialize_model, self.instance)
+            else:
+                payload = partial(
+                    self.hook_model.serialize_model, self.instance, fields=self.fields
+                )
+            user = self.hook_model.get_user(self.instance, self.all_users)
+        self.hook_model.find_and_fire_hooks(self.event_name, payload, user, debounce_key)
+
+
+class EventBuffer(object):
+    """
+    Events recorded during a transaction, fired once it commits and discarded
+    if it is rolled back. Model events are coalesced per (model, pk, action):
+    an object updated five times is only serialized and delivered once, with
+    its final state, and an object created and deleted within the transaction
+    sends nothing at all. With settings.HOOK_DEFER_SERIALIZATION, the model
+    events are handed to the client as `EventRef`s, to be serialized there.
+
+    There is a buffer per savepoint, see `get_event_buffer`. Events are
+    coalesced with those of the other pending buffers of the transaction, but
+    a deletion only cancels the events recorded within its own savepoint, as
+    they're the only ones rolled back along with it.
+    """
+
+    def __init__(self, using, savepoints=(), buffers=None):
+        self.using = using
+        self.connection = connections[using]
+        self.commit_hooks = self.connection.run_on_commit
+        # the savepoints this buffer was created in, innermost last
+        self.savepoints = savepoints
+        # the pending buffers of the transaction, this one included
+        self.buffers = [self] if buffers is None else buffers
+        self.events = OrderedDict()
+        self.flushed = False
+
+    def is_pending(self):
+        """False once the transaction or savepoint this buffer belongs to is over."""
+        if self.flushed:
+            return False
+        if self.connection.run_on_commit is self.commit_hooks:
+            return True
+        if any(hook[1] == self.flush for hook in self.connection.run_on_commit):
+            # the list is rebuilt when rolling back to a savepoint
+            self.commit_hooks = self.connection.run_on_commit
+            return True
+        return False
+
+    def rolls_back_with(self, buffer):
+        """Whether this buffer's events are rolled back along with those of `buffer`."""
+        return not buffer.savepoints or buffer.savepoints[-1] in self.savepoints
+
+    def add_model_event(self, hook_model, instance, action, event_name, all_users, fields=None):
+        """`fields` restricts the payload to the changed fields, for delta events."""
+        if instance.pk is None:
+            key = object()
+        else:
+            key = (instance._meta.label, instance.pk, action)
+        if action != "deleted":
+            for buffer in self.buffers:
+                event = buffer.events.get(key)
+                if event is not None:
+                    # keep the original position, but fire with the latest instance
+                    event.instance = instance
+                    if event.fields is not None:
+                        event.fields = None if fields is None else event.fields | fields
+                    return
+            self.events[key] = DeferredEvent(
+                hook_model, event_name, instance, all_users, fields=fields, action=action
+            )
+            return
+
+        label, pk = instance._meta.label, instance.pk
+        created = None
+        for buffer in self.buffers:
+            if buffer.rolls_back_with(self):
+                created = buffer.events.pop((label, pk, "created"), None) or created
+                buffer.events.pop((label, pk, "updated"), None)
+        if created is not None:
+            # created and deleted within the savepoint, nobody needs to know
+            return
+        # the row is gone by the time we commit, so serialize it right away
+        user = hook_model.get_user(instance, all_users)
+        if not hook_model.find_hooks(event_name, user=user).exists():
+            return
+        payload = hook_model.serialize_model(instance)
+        self.events[key] = DeferredEvent(hook_model, event_name, payload=payload, user=user)
+
+    def add_raw_event(self, hook_model, event_name, payload, user):
+        self.events[object()] = DeferredEvent(hook_model, event_name, payload=payload, user=user)
+
+    def flush(self):
+        self.flushed = True
+        events, self.events = self.events, OrderedDict()
+        refs = []
+        serialize = defers_serialization()
+        for event in events.values():
+            ref = event.ref() if serialize else None
+            if ref is not None:
+                refs.append(ref)
+            else:
+                event.fire()
+        if refs:
+            get_client().defer_events(refs)
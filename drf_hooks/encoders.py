@@ -0,0 +1,219 @@
+import json
+import struct
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from .metrics import get_metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+__ENCODER = None
+
+# a gzip member header without a name or a modification time
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+# an empty final deflate block with fixed Huffman codes
+DEFLATE_END = b"\x03\x00"
+
+# the fields kept in the stub of an oversize payload, to fetch the object with
+STUB_FIELDS = ("id", "pk", "model", "url")
+
+
+def get_payload_encoder():
+    """
+    Returns an instance of settings.HOOK_PAYLOAD_ENCODER,
+    by default `drf_hooks.encoders.JSONEncoder`.
+    """
+    global __ENCODER
+    path = getattr(settings, "HOOK_PAYLOAD_ENCODER", "drf_hooks.encoders.JSONEncoder")
+    if __ENCODER is None or __ENCODER[0] != path:
+        __ENCODER = (path, import_string(path)())
+    return __ENCODER[1]
+
+
+def get_content_encodings():
+    """The `Content-Encoding`s hooks can be delivered with."""
+    return ("gzip", "zstd") if zstandard is not None else ("gzip",)
+
+
+def compress_segment(data):
+    """
+    Compresses `data` as raw deflate blocks ending with a full flush, which
+    resets the history of the compressor, so that it can be concatenated
+    with other segments in a gzip member.
+    """
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+def store_segment(data):
+    """`data` as uncompressed deflate blocks, much cheaper than compressing a few bytes."""
+    segment = b""
+    for start in range(0, len(data), 0xFFFF):
+        block = data[start : start + 0xFFFF]
+        segment += b"\x00" + struct.pack("<HH", len(block), len(block) ^ 0xFFFF) + block
+    return segment
+
+
+def compress(parts, encoding):
+    """
+    Compresses the concatenation of `parts` with `encoding`. With gzip,
+    `EncodedPayload` parts are compressed once and their segment is reused
+    (see `compress_segment`), so a payload delivered to many hooks is
+    compressed once, and the other parts, small envelopes, are stored as is.
+    zstd blocks can't be spliced into another frame, so zstd bodies are
+    compressed whole, as a single frame.
+    """
+    parts = [part for part in parts if part]
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ImproperlyConfigured("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor().compress(b"".join(parts))
+    if encoding != "gzip":
+        raise ValueError("Unsupported content encoding %r" % encoding)
+    segments = []
+    crc = 0
+    size = 0
+    for part in parts:
+        if isinstance(part, EncodedPayload):
+            segments.append(part.compress())
+        elif len(part) < 1024:
+            segments.append(store_segment(part))
+        else:
+            segments.append(compress_segment(part))
+        crc = zlib.crc32(part, crc)
+        size += len(part)
+    trailer = struct.pack("<II", crc, size & 0xFFFFFFFF)
+    return GZIP_HEADER + b"".join(segments) + DEFLATE_END + trailer
+
+
+class EncodedPayload(bytes):
+    """The `data` part of a hook body, already encoded."""
+
+    def compress(self):
+        """Returns this payload compressed as a gzip segment for `compress`, computed once."""
+        segment = self.__dict__.get("segment")
+        if segment is None:
+            segment = self.__dict__["segment"] = compress_segment(self)
+        return segment
+
+
+def encode_payload(data):
+    return EncodedPayload(get_payload_encoder().encode(data))
+
+
+def project(data, fields):
+    """Keeps the `fields` of a payload, if it's an object."""
+    if not isinstance(data, dict):
+        return data
+    return {name: data[name] for name in fields if name in data}
+
+
+def make_stub(data):
+    """The identifying fields of a payload, or None if it has none."""
+    if not isinstance(data, dict) or not any(name in data for name in ("id", "pk", "url")):
+        return None
+    stub = {name: data[name] for name in STUB_FIELDS if name in data}
+    stub["truncated"] = True
+    return stub
+
+
+class EventPayload(object):
+    """
+    The payload of an event, serialized once and encoded once per set of
+    fields hooks want (see `AbstractHook.fields`). It can also be built from
+    the encoded payload alone, which is then only decoded if needed.
+    `encode` is a function returning an `EncodedPayload`.
+    """
+
+    def __init__(self, data=None, encoded=None, encode=None):
+        self.decoded = encoded is None
+        self._data = data
+        self.encoded = {} if encoded is None else {None: EncodedPayload(encoded)}
+        self.encode_data = encode or encode_payload
+
+    @property
+    def data(self):
+        if not self.decoded:
+            self._data = json.loads(self.encoded[None])
+            self.decoded = True
+        return self._data
+
+    def encode(self, fields=None):
+        """Returns the payload encoded, or None if it's too large, see `limit`."""
+        key = None if fields is None else tuple(fields)
+        if key not in self.encoded:
+            data = self.data if fields is None else project(self.data, fields)
+            self.encoded[key] = self.limit(self.encode_data(data), data)
+        return self.encoded[key]
+
+    def limit(self, encoded, data):
+        """
+        Applies settings.HOOK_MAX_PAYLOAD_SIZE, in bytes and unlimited by
+        default. Larger payloads are replaced by a stub with the fields which
+        identify the object, for receivers to fetch it, or dropped with
+        settings.HOOK_OVERSIZE_POLICY = "drop" or when they have no such field.
+        """
+        max_size = getattr(settings, "HOOK_MAX_PAYLOAD_SIZE", None)
+        if not max_size or len(encoded) <= max_size:
+            return encoded
+        policy = getattr(settings, "HOOK_OVERSIZE_POLICY", "stub")
+        if policy not in ("stub", "drop"):
+            raise ImproperlyConfigured('settings.HOOK_OVERSIZE_POLICY must be "stub" or "drop"')
+        stub = make_stub(data) if policy == "stub" else None
+        get_metrics().increment("drf_hooks_oversize_total", policy="stub" if stub else "drop")
+        return None if stub is None else self.encode_data(stub)
+
+
+class JSONEncoder(object):
+    """
+    Encodes payloads with the standard library and DjangoJSONEncoder.
+    The output is identical to what drf-hooks always sent.
+    """
+
+    def encode(self, obj):
+        return json.dumps(obj, cls=DjangoJSONEncoder).encode()
+
+    def envelope(self, hook, data):
+        """Wraps the encoded `data` with the `hook` metadata of a single hook."""
+        prefix, suffix = self.envelope_parts(hook)
+        return prefix + data + suffix
+
+    def envelope_parts(self, hook):
+        """The bytes before and after the data in the `envelope` of `hook`."""
+        return b'{"hook": ' + self.encode(hook) + b', "data": ', b"}"
+
+    def join(self, bodies):
+        """Combines the bodies of many deliveries into a JSON array."""
+        return b"[" + b", ".join(bodies) + b"]"
+
+
+class OrjsonEncoder(JSONEncoder):
+    """
+    Encodes payloads with orjson, falling back to DjangoJSONEncoder for types
+    orjson does not handle (and for dates, so they are formatted the same way).
+    The output is equivalent JSON, without whitespace and not ASCII escaped.
+    """
+
+    def __init__(self):
+        if orjson is None:
+            raise ImproperlyConfigured("OrjsonEncoder requires the orjson package")
+        self.fallback = DjangoJSONEncoder()
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def encode(self, obj):
+        return orjson.dumps(obj, default=self.fallback.default, option=self.options)
+
+    def join(self, bodies):
+        return b"[" + b",".join(bodies) + b"]"
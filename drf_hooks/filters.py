@@ -0,0 +1,215 @@
+"""
+The predicates of `AbstractHook.filter`, a small expression language over the
+fields of a payload, compiled to Python functions without using `eval`:
+
+    is_public == true and (score >= 10 or user.name in ["alice", "bob"])
+
+Operands are fields (dotted names reach into nested objects, missing fields
+are null) and literals: "strings", 'strings', numbers, true, false, null and
+[lists]. Operators are ==, !=, <, <=, >, >=, in, not in, and, or and not, with
+the usual precedence. Comparing values of incompatible types is false.
+"""
+
+import functools
+import operator
+import re
+from contextlib import contextmanager
+
+TOKEN = re.compile(
+    r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z0-9_]+)*)
+      | (?P<op>==|!=|<=|>=|<|>|\(|\)|\[|\]|,)
+    )""",
+    re.VERBOSE,
+)
+
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda a, b: a in b,
+    "not in": lambda a, b: a not in b,
+}
+
+LITERALS = {"true": True, "false": False, "null": None}
+KEYWORDS = {"and", "or", "not", "in"}
+
+MAX_LENGTH = 1000
+MAX_DEPTH = 32
+
+
+class FilterSyntaxError(ValueError):
+    pass
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if match is None:
+            raise FilterSyntaxError("Unexpected character at position %d" % position)
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "name" and value in KEYWORDS:
+            kind = "op"
+        tokens.append((kind, value))
+    return tokens
+
+
+def get_field(data, path):
+    for name in path:
+        if isinstance(data, dict):
+            data = data.get(name)
+        elif isinstance(data, (list, tuple)) and name.isdigit() and int(name) < len(data):
+            data = data[int(name)]
+        else:
+            return None
+    return data
+
+
+def unescape(string):
+    return re.sub(r"\\(.)", r"\1", string[1:-1])
+
+
+class Parser(object):
+    """Recursive descent parser turning tokens into nested functions of the payload."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.depth = 0
+
+    @contextmanager
+    def nest(self):
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise FilterSyntaxError("Filters are limited to %d nested levels" % MAX_DEPTH)
+        try:
+            yield
+        finally:
+            self.depth -= 1
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self, value=None):
+        kind, token = self.peek()
+        if kind is None:
+            raise FilterSyntaxError("Unexpected end of filter")
+        if value is not None and token != value:
+            raise FilterSyntaxError("Expected '%s', got '%s'" % (value, token))
+        self.position += 1
+        return kind, token
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.peek()[0] is not None:
+            raise FilterSyntaxError("Unexpected '%s'" % self.peek()[1])
+        return predicate
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.peek() == ("op", "or"):
+            self.take()
+            operands.append(self.parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda data: any(operand(data) for operand in operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while self.peek() == ("op", "and"):
+            self.take()
+            operands.append(self.parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda data: all(operand(data) for operand in operands)
+
+    def parse_not(self):
+        if self.peek() == ("op", "not"):
+            self.take()
+            with self.nest():
+                operand = self.parse_not()
+            return lambda data: not operand(data)
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        if self.peek() == ("op", "("):
+            self.take()
+            with self.nest():
+                predicate = self.parse_or()
+                self.take(")")
+            return predicate
+        left = self.parse_operand()
+        kind, token = self.peek()
+        if token == "not" and self.tokens[self.position + 1 : self.position + 2] == [("op", "in")]:
+            self.take()
+            token = "not in"
+        elif kind != "op" or token not in COMPARISONS:
+            # a field or literal on its own is tested for truthiness
+            return lambda data: bool(left(data))
+        self.take()
+        right = self.parse_operand()
+        compare = COMPARISONS[token]
+
+        def predicate(data):
+            try:
+                return bool(compare(left(data), right(data)))
+            except TypeError:
+                return False
+
+        return predicate
+
+    def parse_operand(self):
+        kind, token = self.peek()
+        if kind == "name" and token not in LITERALS:
+            self.take()
+            path = token.split(".")
+            return lambda data: get_field(data, path)
+        value = self.parse_literal()
+        return lambda data: value
+
+    def parse_literal(self):
+        kind, token = self.take()
+        if kind == "number":
+            return float(token) if "." in token else int(token)
+        if kind == "string":
+            return unescape(token)
+        if kind == "name" and token in LITERALS:
+            return LITERALS[token]
+        if token == "[":
+            values = []
+            with self.nest():
+                while self.peek() != ("op", "]"):
+                    values.append(self.parse_literal())
+                    if self.peek() != ("op", "]"):
+                        self.take(",")
+                self.take("]")
+            return values
+        raise FilterSyntaxError("Unexpected '%s'" % token)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_filter(expression):
+    """
+    Returns a function of a payload returning whether it matches `expression`.
+    Compiled filters are cached, so hooks with the same filter share one.
+    Raises `FilterSyntaxError` for invalid expressions.
+    """
+    if len(expression) > MAX_LENGTH:
+        raise FilterSyntaxError("Filters are limited to %d characters" % MAX_LENGTH)
+    tokens = tokenize(expression)
+    if not tokens:
+        raise FilterSyntaxError("Empty filter")
+    return Parser(tokens).parse()
@@ -0,0 +1,122 @@
+import secrets
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+
+__INDEX = None
+
+VERSION_KEY = "drf_hooks:subscription_index:version"
+
+
+def get_subscription_index():
+    """
+    Returns the process wide subscription index, or None if
+    settings.HOOK_SUBSCRIPTION_INDEX is not enabled.
+    """
+    global __INDEX
+    if not getattr(settings, "HOOK_SUBSCRIPTION_INDEX", False):
+        return None
+    if __INDEX is None:
+        __INDEX = SubscriptionIndex()
+    return __INDEX
+
+
+def clear_subscription_index():
+    global __INDEX
+    __INDEX = None
+
+
+class SubscriptionIndex(object):
+    """
+    In-memory map of which (event, user_id) pairs have at least one hook.
+
+    The index is loaded lazily from the hook model and is only used to answer
+    "can there be any hook for this event?". A positive answer still goes to the
+    database, so it is always safe for the index to contain too much; it must
+    never contain too little. Processes share a version counter in the Django
+    cache (settings.HOOK_INDEX_CACHE) which is bumped whenever a hook is saved or
+    deleted, so that other processes reload their copy. The counter starts at
+    a random value, so that a counter evicted from the cache and created again
+    doesn't come back to a version a process already loaded. The index is
+    loaded from the database the routers pick for writes, as a read replica
+    lagging behind could miss a hook saved before the version was bumped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = None
+        self.version = None
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "HOOK_INDEX_CACHE", "default")]
+
+    def get_remote_version(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            # first process to look wins, everybody else reads its value
+            self.cache.add(VERSION_KEY, secrets.randbits(62), timeout=None)
+            version = self.cache.get(VERSION_KEY)
+        return version
+
+    def load(self, version):
+        from .models import get_hook_model
+
+        hook_model = get_hook_model()
+        hooks = hook_model.objects.using(router.db_for_write(hook_model))
+        subscribers = {}
+        pairs = hooks.values_list("event", "user_id").distinct()
+        for event_name, user_id in pairs.iterator():
+            subscribers.setdefault(event_name, set()).add(user_id)
+        self.subscribers = subscribers
+        self.version = version
+
+    def has_subscribers(self, event_name, user=None):
+        """
+        Returns False only if there definitely is no hook for `event_name`
+        (restricted to `user` if given).
+        """
+        version = self.get_remote_version()
+        with self.lock:
+            if self.subscribers is None or self.version != version:
+                self.load(version)
+            users = self.subscribers.get(event_name)
+        if not users:
+            return False
+        if user is None:
+            return True
+        return getattr(user, "pk", user) in users
+
+    def invalidate(self):
+        with self.lock:
+            self.subscribers = None
+            self.version = None
+
+    def hook_saved(self, hook):
+        with self.lock:
+            if self.subscribers is not None:
+                # adding is always safe, even before the transaction commits
+                self.subscribers.setdefault(hook.event, set()).add(hook.user_id)
+        transaction.on_commit(self.bump_version)
+
+    def hook_deleted(self, hook):
+        # a stale entry only costs a query, so just let everyone reload
+        transaction.on_commit(self.bump_version)
+
+    def bump_version(self):
+        self.get_remote_version()
+        try:
+            version = self.cache.incr(VERSION_KEY)
+        except ValueError:
+            # the key was evicted in the meantime
+            self.invalidate()
+            return
+        with self.lock:
+            if self.version == version - 1:
+                # nobody else changed anything, our copy is up to date
+                self.version = version
+            else:
+                self.subscribers = None
+                self.version = None
@@ -0,0 +1,114 @@
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from drf_hooks.batching import flush_batcher
+from drf_hooks.bulk import backfill, get_event_model
+from drf_hooks.client import get_client
+from drf_hooks.models import get_hook_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires a model event for the existing rows of its model, e.g. to send the current "
+        "state of all objects to a new subscriber."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("event", help="A model event of settings.HOOK_EVENTS.")
+        parser.add_argument("--user", help="Only deliver to the hooks of this user (username).")
+        parser.add_argument("--hook", type=int, help="Only deliver to this hook (id).")
+        parser.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            metavar="LOOKUP=VALUE",
+            help="Only fire the event for the rows matching this lookup (repeatable).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500, help="Rows per chunk.")
+        parser.add_argument("--rate", type=float, help="Maximum deliveries per second.")
+        parser.add_argument("--after", help="Start after the row with this primary key.")
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording the last row delivered, to resume from if it exists.",
+        )
+
+    def handle(self, *args, **options):
+        event_name = options["event"]
+        hook_model = get_hook_model()
+        try:
+            model, action = get_event_model(event_name)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        hooks = hook_model.find_hooks(event_name)
+        if options["user"]:
+            try:
+                user = get_user_model()._default_manager.get_by_natural_key(options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError("User %s does not exist" % options["user"])
+            hooks = hooks.filter(user=user)
+        if options["hook"]:
+            hooks = hooks.filter(pk=options["hook"])
+        if not hooks.exists():
+            raise CommandError("No hooks to deliver %s to" % event_name)
+
+        queryset = hook_model.get_serialization_queryset(model)
+        for lookup in options["filter"]:
+            name, sep, value = lookup.partition("=")
+            if not sep:
+                raise CommandError("Filters must look like LOOKUP=VALUE, got %s" % lookup)
+            queryset = queryset.filter(**{name: value})
+
+        after = options["after"]
+        checkpoint = options["checkpoint"]
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                after = json.load(f)["after"]
+            self.stdout.write("Resuming after %s." % after)
+
+        rows = deliveries = 0
+        started = time.monotonic()
+        try:
+            chunks = backfill(
+                event_name,
+                queryset=queryset,
+                hooks=hooks,
+                chunk_size=options["chunk_size"],
+                after=after,
+            )
+            for after, chunk_rows, chunk_deliveries in chunks:
+                self.wait_for_client()
+                rows += chunk_rows
+                deliveries += chunk_deliveries
+                if checkpoint:
+                    self.write_checkpoint(checkpoint, event_name, after)
+                if options["verbosity"] > 1:
+                    self.stdout.write("Delivered up to %s (%d rows)." % (after, rows))
+                if options["rate"]:
+                    # sleep until the deliveries so far fit the rate
+                    time.sleep(max(0, deliveries / options["rate"] - (time.monotonic() - started)))
+        except (ValueError, FieldError) as e:
+            raise CommandError(str(e))
+        self.stdout.write("Backfilled %d rows with %d deliveries." % (rows, deliveries))
+
+    def wait_for_client(self):
+        """
+        Waits for the deliveries of the last chunk, so that the queue doesn't
+        grow with the number of rows and the checkpoint only covers rows which
+        were delivered (or handed to the outbox or the spool).
+        """
+        flush_batcher()
+        client = get_client()
+        if hasattr(client, "drain"):
+            client.drain()
+
+    def write_checkpoint(self, path, event_name, after):
+        with open(path + ".tmp", "w") as f:
+            json.dump({"event": event_name, "after": after}, f, cls=DjangoJSONEncoder)
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,85 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from drf_hooks.spool import Spool, SpoolWorker, get_worker_name, run_worker
+
+
+class Command(BaseCommand):
+    help = "Delivers the hooks written to the spool directory (see HOOK_SPOOL_DIR)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, help="Worker processes to start.")
+        parser.add_argument("--concurrency", type=int, help="Maximum threads per process.")
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0.5,
+            help="Seconds to wait when the spool is empty.",
+        )
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=30,
+            help="Seconds to wait for the deliveries in flight when stopping.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Deliver in this process and exit when done."
+        )
+
+    def handle(self, *args, **options):
+        directory = getattr(settings, "HOOK_SPOOL_DIR", None)
+        if not directory:
+            raise CommandError("settings.HOOK_SPOOL_DIR is not set")
+        spool = Spool(directory)
+        # the files claimed by the workers which died before they were done
+        spool.recover_dead()
+
+        if options["once"]:
+            worker = SpoolWorker.from_settings(concurrency=options["concurrency"])
+            total = 0
+            while True:
+                count = worker.run_once()
+                worker.drain()
+                if not count:
+                    break
+                total += count
+            self.stdout.write("Delivered %d hooks." % total)
+            return
+
+        processes = options["processes"] or getattr(settings, "HOOK_SPOOL_PROCESSES", 2)
+        kwargs = {
+            "concurrency": options["concurrency"],
+            "poll_interval": options["poll_interval"],
+            "grace": options["grace"],
+        }
+        context = multiprocessing.get_context("spawn")
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+        def start():
+            worker = context.Process(target=run_worker, kwargs=kwargs)
+            worker.start()
+            return worker
+
+        workers = [None] * processes
+        while not stop.is_set():
+            self.restart_workers(spool, workers, start)
+            stop.wait(1)
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+    def restart_workers(self, spool, workers, start):
+        """Replaces the workers that are not running, putting back what the dead ones claimed."""
+        for index, worker in enumerate(workers):
+            if worker is None or not worker.is_alive():
+                if worker is not None:
+                    self.stderr.write("Worker %d exited, restarting it." % worker.pid)
+                    spool.recover_dead([get_worker_name(worker.pid)])
+                workers[index] = start()
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from drf_hooks.metrics import collect, render_prometheus
+
+
+def quantile(buckets, histogram, q):
+    """Upper bound of the bucket holding the `q` quantile."""
+    count = sum(histogram[:-1])
+    seen = 0
+    for bound, n in zip(list(buckets) + [float("inf")], histogram):
+        seen += n
+        if seen >= q * count:
+            return bound
+    return float("inf")
+
+
+class Command(BaseCommand):
+    help = "Shows the delivery metrics published by the processes firing hooks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=["text", "prometheus"],
+            default="text",
+            help="Output format.",
+        )
+
+    def handle(self, *args, **options):
+        metrics = collect()
+        if options["format"] == "prometheus":
+            self.stdout.write(render_prometheus(metrics), ending="")
+            return
+
+        def label(name, tags):
+            return name + "".join(" %s=%s" % tag for tag in tags)
+
+        if not any(metrics[kind] for kind in ("counters", "gauges", "histograms")):
+            self.stdout.write("No metrics published yet.")
+            return
+        for (name, tags), value in sorted(metrics["counters"].items()):
+            self.stdout.write("%s: %s" % (label(name, tags), value))
+        for (name, tags), value in sorted(metrics["gauges"].items()):
+            self.stdout.write("%s: %s" % (label(name, tags), value))
+        for (name, tags), histogram in sorted(metrics["histograms"].items()):
+            count = sum(histogram[:-1])
+            if not count:
+                continue
+            self.stdout.write(
+                "%s: count=%d mean=%.4fs p50<=%ss p95<=%ss p99<=%ss"
+                % (
+                    label(name, tags),
+                    count,
+                    histogram[-1] / count,
+                    quantile(metrics["buckets"], histogram, 0.5),
+                    quantile(metrics["buckets"], histogram, 0.95),
+                    quantile(metrics["buckets"], histogram, 0.99),
+                )
+            )
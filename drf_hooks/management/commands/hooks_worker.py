@@ -0,0 +1,38 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from drf_hooks.outbox import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = "Delivers the hooks waiting in the outbox (see HOOK_OUTBOX)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Deliveries claimed at once.")
+        parser.add_argument("--concurrency", type=int, help="Deliveries sent in parallel.")
+        parser.add_argument("--lease", type=int, help="Seconds before a claim expires.")
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1,
+            help="Seconds to wait when the outbox is empty.",
+        )
+        parser.add_argument("--once", action="store_true", help="Exit once nothing is due anymore.")
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker.from_settings(
+            batch_size=options["batch_size"],
+            concurrency=options["concurrency"],
+            lease=options["lease"],
+        )
+        if options["once"]:
+            count = worker.drain()
+            self.stdout.write("Delivered %d hooks." % count)
+            return
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        worker.run(poll_interval=options["poll_interval"], stop=stop)
@@ -0,0 +1,236 @@
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+__METRICS = None
+
+REGISTRY_KEY = "drf_hooks:metrics:processes"
+SNAPSHOT_KEY = "drf_hooks:metrics:%s"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def get_metrics():
+    """
+    Returns an instance of settings.HOOK_METRICS, e.g.
+    `drf_hooks.metrics.InMemoryMetrics`. By default nothing is recorded.
+    """
+    global __METRICS
+    path = getattr(settings, "HOOK_METRICS", None)
+    if __METRICS is None or __METRICS[0] != path:
+        __METRICS = (path, import_string(path)() if path else Metrics())
+    return __METRICS[1]
+
+
+def clear_metrics():
+    global __METRICS
+    __METRICS = None
+
+
+if hasattr(os, "register_at_fork"):
+    # a child starts counting from zero, under its own pid
+    os.register_at_fork(after_in_child=clear_metrics)
+
+
+class Metrics(object):
+    """
+    Records nothing. Subclass it to send the metrics of drf-hooks to your
+    metrics library, and point settings.HOOK_METRICS to your class.
+
+    Names are Prometheus style and tags are passed as keyword arguments:
+
+    - drf_hooks_signals_total (model, action): model events received
+    - drf_hooks_events_total (event): events with at least one hook
+    - drf_hooks_find_hooks_seconds (event): subscriber queries
+    - drf_hooks_serialize_seconds (model): serializing instances
+    - drf_hooks_encode_seconds (event): encoding payloads
+    - drf_hooks_enqueue_seconds: handing deliveries to the client
+    - drf_hooks_queue_depth: deliveries waiting in the client queue
+    - drf_hooks_dropped_total: deliveries dropped because the queue was full
+    - drf_hooks_debounced_total: deliveries replaced by a newer one, see `debounce`
+    - drf_hooks_deliver_seconds (host): delivery requests
+    - drf_hooks_responses_total (host, status): delivery outcomes, with the
+      status code or "error" for transport errors
+    """
+
+    def increment(self, name, value=1, **tags):
+        pass
+
+    def gauge(self, name, value, **tags):
+        pass
+
+    def timing(self, name, seconds, **tags):
+        pass
+
+    @contextmanager
+    def timer(self, name, **tags):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, time.perf_counter() - started, **tags)
+
+
+class InMemoryMetrics(Metrics):
+    """
+    Aggregates the metrics of this process in memory, as counters, gauges and
+    histograms with `DEFAULT_BUCKETS`. Every settings.HOOK_METRICS_INTERVAL
+    seconds (10 by default) a snapshot is published to the
+    settings.HOOK_METRICS_CACHE cache, from which `manage.py hooks_metrics` and
+    `MetricsView` read the metrics of all processes. Use a cache shared by the
+    processes, e.g. redis or memcached.
+
+    The processes are listed in a registry with the time their snapshot
+    expires, so that processes which exited are dropped from it. A process
+    only rewrites the registry when its own entry is about to expire.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.interval = getattr(settings, "HOOK_METRICS_INTERVAL", 10)
+        self.published = time.monotonic()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "HOOK_METRICS_CACHE", "default")]
+
+    @staticmethod
+    def key(name, tags):
+        return (name, tuple(sorted((k, str(v)) for k, v in tags.items())))
+
+    def increment(self, name, value=1, **tags):
+        key = self.key(name, tags)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.maybe_publish()
+
+    def gauge(self, name, value, **tags):
+        key = self.key(name, tags)
+        with self.lock:
+            self.gauges[key] = value
+        self.maybe_publish()
+
+    def timing(self, name, seconds, **tags):
+        key = self.key(name, tags)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # one count per bucket plus +Inf, then the sum
+                histogram = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[-1] += seconds
+        self.maybe_publish()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "buckets": list(self.buckets),
+                "counters": [[n, list(t), v] for (n, t), v in self.counters.items()],
+                "gauges": [[n, list(t), v] for (n, t), v in self.gauges.items()],
+                "histograms": [[n, list(t), list(h)] for (n, t), h in self.histograms.items()],
+            }
+
+    def maybe_publish(self):
+        if time.monotonic() - self.published >= self.interval:
+            try:
+                self.publish()
+            except Exception:
+                # metrics are never worth failing a delivery for
+                logger.exception("Failed to publish hook metrics")
+
+    def publish(self):
+        """Publishes the metrics of this process to the cache."""
+        self.published = time.monotonic()
+        process = "%s:%d" % (socket.gethostname(), os.getpid())
+        timeout = max(60, self.interval * 6)
+        self.cache.set(SNAPSHOT_KEY % process, self.snapshot(), timeout=timeout)
+        now = time.time()
+        processes = self.cache.get(REGISTRY_KEY) or {}
+        if processes.get(process, 0) - now < timeout / 2:
+            # best effort, a process lost in a race adds itself again next time
+            processes = {name: expires for name, expires in processes.items() if expires > now}
+            processes[process] = now + timeout
+            self.cache.set(REGISTRY_KEY, processes, timeout=timeout)
+
+
+def get_live_processes(cache):
+    """The processes of the registry whose snapshot hasn't expired yet."""
+    now = time.time()
+    processes = cache.get(REGISTRY_KEY) or {}
+    return [name for name, expires in processes.items() if expires > now]
+
+
+def collect(cache=None):
+    """Merges the snapshots published by all processes which are still alive."""
+    cache = cache or caches[getattr(settings, "HOOK_METRICS_CACHE", "default")]
+    processes = get_live_processes(cache)
+    snapshots = cache.get_many([SNAPSHOT_KEY % process for process in processes])
+    merged = {"buckets": list(DEFAULT_BUCKETS), "counters": {}, "gauges": {}, "histograms": {}}
+    for snapshot in snapshots.values():
+        merged["buckets"] = snapshot["buckets"]
+        for kind in ("counters", "gauges"):
+            for name, tags, value in snapshot[kind]:
+                key = (name, tuple(tuple(tag) for tag in tags))
+                merged[kind][key] = merged[kind].get(key, 0) + value
+        for name, tags, histogram in snapshot["histograms"]:
+            key = (name, tuple(tuple(tag) for tag in tags))
+            total = merged["histograms"].get(key)
+            if total is None:
+                merged["histograms"][key] = list(histogram)
+            else:
+                merged["histograms"][key] = [a + b for a, b in zip(total, histogram)]
+    return merged
+
+
+def format_labels(tags, extra=()):
+    labels = list(tags) + list(extra)
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join('%s="%s"' % label for label in escaped) + "}"
+
+
+def render_prometheus(metrics):
+    """Renders metrics merged by `collect` in the Prometheus text format."""
+    lines = []
+    declared = set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            lines.append("# TYPE %s %s" % (name, kind))
+
+    for (name, tags), value in sorted(metrics["counters"].items()):
+        declare(name, "counter")
+        lines.append("%s%s %s" % (name, format_labels(tags), value))
+    for (name, tags), value in sorted(metrics["gauges"].items()):
+        declare(name, "gauge")
+        lines.append("%s%s %s" % (name, format_labels(tags), value))
+    for (name, tags), histogram in sorted(metrics["histograms"].items()):
+        declare(name, "histogram")
+        cumulative = 0
+        bounds = [str(bound) for bound in metrics["buckets"]] + ["+Inf"]
+        for bound, count in zip(bounds, histogram):
+            cumulative += count
+            labels = format_labels(tags, [("le", bound)])
+            lines.append("%s_bucket%s %d" % (name, labels, cumulative))
+        lines.append("%s_sum%s %s" % (name, format_labels(tags), histogram[-1]))
+        lines.append("%s_count%s %d" % (name, format_labels(tags), cumulative))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-17 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+import drf_hooks.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("drf_hooks", "0002_alter_hook_user"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Delivery",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("hook_id", models.BigIntegerField(blank=True, null=True)),
+                ("target", models.URLField(max_length=255, verbose_name="Target URL")),
+                ("headers", models.JSONField(default=drf_hooks.models.get_default_headers)),
+                ("body", models.BinaryField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "Pending"), ("done", "Done"), ("failed", "Failed")],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("next_attempt", models.DateTimeField(default=django.utils.timezone.now)),
+                ("claimed_by", models.CharField(blank=True, max_length=32)),
+                ("claimed_until", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name_plural": "deliveries",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt"], name="drf_hooks_delivery_due_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:21
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("drf_hooks", "0003_delivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hook",
+            name="batch_interval",
+            field=models.PositiveIntegerField(
+                blank=True,
+                default=1000,
+                help_text="Milliseconds to wait for a batch to fill up.",
+                verbose_name="Batch interval",
+            ),
+        ),
+        migrations.AddField(
+            model_name="hook",
+            name="batch_size",
+            field=models.PositiveIntegerField(
+                blank=True,
+                default=1,
+                help_text="Deliver up to this many events per request, as a JSON array.",
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="Batch size",
+            ),
+        ),
+    ]
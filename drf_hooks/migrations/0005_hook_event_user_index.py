@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("drf_hooks", "0004_hook_batching"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="hook",
+            index=models.Index(fields=["event", "user"], name="drf_hooks_h_event_053f11_idx"),
+        ),
+        migrations.AlterField(
+            model_name="hook",
+            name="event",
+            field=models.CharField(max_length=64, verbose_name="Event"),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("drf_hooks", "0005_hook_event_user_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hook",
+            name="fields",
+            field=models.JSONField(
+                blank=True,
+                help_text="Only deliver these fields of the payload.",
+                null=True,
+                verbose_name="Fields",
+            ),
+        ),
+        migrations.AddField(
+            model_name="hook",
+            name="filter",
+            field=models.CharField(
+                blank=True,
+                help_text="Only deliver events matching this expression, e.g. is_public == true.",
+                max_length=1000,
+                verbose_name="Filter",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("drf_hooks", "0006_hook_filter_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hook",
+            name="content_encoding",
+            field=models.CharField(
+                blank=True,
+                choices=[("gzip", "gzip"), ("zstd", "zstd")],
+                default="",
+                help_text="Compress deliveries, zstd requires the zstandard package.",
+                max_length=8,
+                verbose_name="Content encoding",
+            ),
+        ),
+    ]
@@ -1,32 +1,72 @@
-import json
-from collections import OrderedDict, defaultdict
-
+import copy
+import itertools
+import logging
+import threading
+from collections import OrderedDict, defaultdict, namedtuple
+from contextlib import contextmanager
+from functools import partial
+
+import django
+from asgiref.sync import sync_to_async
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core import serializers
-from django.core.exceptions import ImproperlyConfigured, ValidationError
-from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
-from django.db.models.signals import post_delete, post_save
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, ValidationError
+from django.core.signals import setting_changed
+from django.core.validators import MinValueValidator
+from django.db import DEFAULT_DB_ALIAS, models, router
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.module_loading import import_string
 
+from .aio import get_async_client
+from .batching import get_batcher
 from .client import get_client
+from .deferred import EventRef, defers_serialization, get_event_buffer, is_deferred
+from .encoders import (
+    EncodedPayload,
+    EventPayload,
+    compress,
+    get_content_encodings,
+    get_payload_encoder,
+)
+from .filters import FilterSyntaxError, compile_filter
+from .index import get_subscription_index
+from .metrics import get_metrics
 from .signals import hook_event, raw_hook_event
 
+logger = logging.getLogger(__name__)
+
 __EVENT_LOOKUP = None
+__EVENT_OPTIONS = None
+__DISPATCH_TABLE = None
 __HOOK_MODEL = None
 
 if not hasattr(settings, "HOOK_EVENTS"):
     raise Exception("You need to define settings.HOOK_EVENTS!")
 
 
+EventOptions = namedtuple("EventOptions", ["fields", "delta", "debounce"])
+DEFAULT_EVENT_OPTIONS = EventOptions(fields=None, delta=False, debounce=0)
+
+
 def get_event_lookup():
-    global __EVENT_LOOKUP
+    """
+    Maps the models and actions of settings.HOOK_EVENTS to (event_name, all_users).
+    Entries are either 'App.Model.Action' strings or dicts with an "action" key
+    and the `fields` and `delta` options of updated events, or a `debounce`
+    window in milliseconds.
+    """
+    global __EVENT_LOOKUP, __EVENT_OPTIONS
     if not __EVENT_LOOKUP:
         __EVENT_LOOKUP = defaultdict(dict)
+        __EVENT_OPTIONS = {}
         for event_name, auto in settings.HOOK_EVENTS.items():
+            options = {}
+            if isinstance(auto, dict):
+                options, auto = auto, auto.get("action")
             if not auto:
                 continue
             model, action = auto.rstrip("+").rsplit(".", 1)
@@ -38,12 +78,104 @@ def get_event_lookup():
                     )
                 )
             __EVENT_LOOKUP[model][action] = (event_name, all_users)
+            if (options.get("fields") or options.get("delta")) and action != "updated":
+                raise ImproperlyConfigured(
+                    "settings.HOOK_EVENTS['%s']: fields and delta only apply to updated "
+                    "events" % event_name
+                )
+            debounce = options.get("debounce") or 0
+            if not isinstance(debounce, int) or debounce < 0:
+                raise ImproperlyConfigured(
+                    "settings.HOOK_EVENTS['%s']: debounce must be a number of milliseconds"
+                    % event_name
+                )
+            if options.get("fields") or options.get("delta") or debounce:
+                fields = options.get("fields")
+                __EVENT_OPTIONS[event_name] = EventOptions(
+                    fields=frozenset(fields) if fields else None,
+                    delta=bool(options.get("delta")),
+                    debounce=debounce,
+                )
     return __EVENT_LOOKUP
 
 
+def get_event_options(event_name):
+    """Returns the `fields`, `delta` and `debounce` options of `event_name`."""
+    get_event_lookup()
+    return __EVENT_OPTIONS.get(event_name, DEFAULT_EVENT_OPTIONS)
+
+
 def clear_event_lookup():
-    global __EVENT_LOOKUP
+    global __EVENT_LOOKUP, __EVENT_OPTIONS
     __EVENT_LOOKUP = None
+    __EVENT_OPTIONS = None
+
+
+class DispatchTable(object):
+    """
+    settings.HOOK_EVENTS and settings.HOOK_SERIALIZERS resolved to model and
+    serializer classes. The post_save and post_delete receivers are only
+    connected for models which actually have created/updated/deleted events,
+    so saving any other model doesn't go through drf-hooks at all.
+    """
+
+    def __init__(self):
+        self.serializers = {}
+        self.receivers = []
+        self.tracked = {}
+        for label, path in getattr(settings, "HOOK_SERIALIZERS", {}).items():
+            self.serializers[label] = import_string(path)
+        for label, actions in get_event_lookup().items():
+            try:
+                model = apps.get_model(label)
+            except (ValueError, LookupError):
+                raise ImproperlyConfigured(
+                    "settings.HOOK_EVENTS refers to unknown model '%s'" % label
+                )
+            if "created" in actions or "updated" in actions:
+                self.receivers.append((post_save, model_saved, model, "instance-saved-hook"))
+            if "updated" in actions:
+                self.track(model, get_event_options(actions["updated"][0]))
+            if "deleted" in actions:
+                self.receivers.append((post_delete, model_deleted, model, "instance-deleted-hook"))
+
+    def track(self, model, options):
+        """Snapshots the watched fields of `model` when instances are loaded."""
+        if options.fields is None and not options.delta:
+            return
+        if options.fields is None:
+            fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+        else:
+            try:
+                fields = [model._meta.get_field(name) for name in options.fields]
+            except FieldDoesNotExist as e:
+                raise ImproperlyConfigured("settings.HOOK_EVENTS: %s" % e)
+        self.tracked[model] = {field.name: field.attname for field in fields}
+        self.receivers.append((post_init, model_initialized, model, "instance-init-hook"))
+
+    def connect(self):
+        for signal, func, model, dispatch_uid in self.receivers:
+            signal.connect(func, sender=model, dispatch_uid=dispatch_uid)
+
+    def disconnect(self):
+        for signal, func, model, dispatch_uid in self.receivers:
+            signal.disconnect(func, sender=model, dispatch_uid=dispatch_uid)
+
+
+def get_dispatch_table():
+    if __DISPATCH_TABLE is None:
+        compile_dispatch_table()
+    return __DISPATCH_TABLE
+
+
+def compile_dispatch_table():
+    """(Re)builds the dispatch table and connects its model receivers."""
+    global __DISPATCH_TABLE
+    table = DispatchTable()
+    if __DISPATCH_TABLE is not None:
+        __DISPATCH_TABLE.disconnect()
+    table.connect()
+    __DISPATCH_TABLE = table
 
 
 def get_hook_model():
@@ -67,6 +199,74 @@ def get_hook_model():
     return __HOOK_MODEL
 
 
+def clean_python_serialization(data):
+    for k, v in data.items():
+        if isinstance(v, OrderedDict):
+            data[k] = dict(v)
+    if isinstance(data, OrderedDict):
+        data = dict(data)
+    return data
+
+
+def restrict_fields(serializer, model, fields):
+    """Drops the fields of a DRF `serializer` other than the primary key and `fields`."""
+    keep = set(fields) | {"pk", model._meta.pk.name}
+    for name in list(serializer.fields):
+        if name not in keep:
+            serializer.fields.pop(name)
+
+
+SNAPSHOT_ATTRIBUTE = "_drf_hooks_snapshot"
+
+
+def take_snapshot(instance, fields=None):
+    """Remembers the values of the watched fields of `instance` (or only of `fields`)."""
+    tracked = get_dispatch_table().tracked.get(type(instance))
+    if not tracked:
+        return
+    values = instance.__dict__
+    snapshot = values.get(SNAPSHOT_ATTRIBUTE)
+    if snapshot is None or fields is None:
+        snapshot = values[SNAPSHOT_ATTRIBUTE] = {}
+    for name, attname in tracked.items():
+        # deferred fields are not loaded, and must not be
+        if attname in values and (fields is None or name in fields):
+            snapshot[attname] = copy.deepcopy(values[attname])
+
+
+def get_changed_fields(instance, update_fields=None):
+    """
+    Returns the names of the watched fields of `instance` which changed since
+    it was loaded or last saved, or None if its model doesn't watch fields.
+    With `update_fields`, only those fields are considered.
+    """
+    tracked = get_dispatch_table().tracked.get(type(instance))
+    if tracked is None:
+        return None
+    if update_fields is not None:
+        names = {instance._meta.get_field(name).name for name in update_fields}
+        tracked = {name: attname for name, attname in tracked.items() if name in names}
+    snapshot = instance.__dict__.get(SNAPSHOT_ATTRIBUTE)
+    if snapshot is None:
+        # created with the constructor, assume the saved fields changed
+        return set(tracked) if update_fields is not None else None
+    values = instance.__dict__
+    return {
+        name
+        for name, attname in tracked.items()
+        if attname in values and (attname not in snapshot or snapshot[attname] != values[attname])
+    }
+
+
+def filter_changed_fields(model, names):
+    """The watched fields of `model` among `names`, or None if it doesn't watch fields."""
+    tracked = get_dispatch_table().tracked.get(model)
+    if tracked is None:
+        return None
+    names = {model._meta.get_field(name).name for name in names}
+    return {name for name in tracked if name in names}
+
+
 def get_default_headers():
     return {"Content-Type": "application/json"}
 
@@ -82,58 +282,468 @@ class AbstractHook(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, related_name="%(class)ss", on_delete=models.CASCADE
     )
-    event = models.CharField("Event", max_length=64, db_index=True)
+    event = models.CharField("Event", max_length=64)
     target = models.URLField("Target URL", max_length=255)
     headers = models.JSONField(default=get_default_headers)
+    batch_size = models.PositiveIntegerField(
+        "Batch size",
+        default=1,
+        blank=True,
+        validators=[MinValueValidator(1)],
+        help_text="Deliver up to this many events per request, as a JSON array.",
+    )
+    batch_interval = models.PositiveIntegerField(
+        "Batch interval",
+        default=1000,
+        blank=True,
+        help_text="Milliseconds to wait for a batch to fill up.",
+    )
+    filter = models.CharField(
+        "Filter",
+        max_length=1000,
+        blank=True,
+        help_text="Only deliver events matching this expression, e.g. is_public == true.",
+    )
+    fields = models.JSONField(
+        "Fields",
+        null=True,
+        blank=True,
+        help_text="Only deliver these fields of the payload.",
+    )
+    content_encoding = models.CharField(
+        "Content encoding",
+        max_length=8,
+        blank=True,
+        default="",
+        choices=[("gzip", "gzip"), ("zstd", "zstd")],
+        help_text="Compress deliveries, zstd requires the zstandard package.",
+    )
+
+    # the columns fetched when delivering, extend it if you override `deliver_hook`
+    delivery_fields = (
+        "id",
+        "user",
+        "event",
+        "target",
+        "headers",
+        "batch_size",
+        "batch_interval",
+        "filter",
+        "fields",
+        "content_encoding",
+    )
 
     class Meta:
         abstract = True
+        # subscribers are looked up by event, and by event and user
+        indexes = [models.Index(fields=["event", "user"])]
 
     def clean(self):
-        """Validation for events."""
+        """Validation for events, filters, fields and content encodings."""
         if self.event not in settings.HOOK_EVENTS.keys():
             raise ValidationError("Invalid hook event {evt}.".format(evt=self.event))
+        if self.filter:
+            try:
+                compile_filter(self.filter)
+            except FilterSyntaxError as e:
+                raise ValidationError({"filter": str(e)})
+        if self.fields is not None and (
+            not isinstance(self.fields, list)
+            or not all(isinstance(name, str) for name in self.fields)
+        ):
+            raise ValidationError({"fields": "Fields must be a list of field names."})
+        if self.content_encoding and self.content_encoding not in get_content_encodings():
+            raise ValidationError(
+                {"content_encoding": "zstd requires the zstandard package to be installed."}
+            )
 
     @staticmethod
-    def serialize_model(instance):
-        hook_srls = getattr(settings, "HOOK_SERIALIZERS", {})
-        if instance._meta.label in hook_srls:
-            serializer = import_string(hook_srls[instance._meta.label])
-            context = {"request": None}
-            data = serializer(instance, context=context).data
-        else:
-            # if no user defined serializers, fallback to the django builtin!
-            data = serializers.serialize("python", [instance])[0]
-            for k, v in data.items():
-                if isinstance(v, OrderedDict):
-                    data[k] = dict(v)
-            if isinstance(data, OrderedDict):
-                data = dict(data)
+    def serialize_model(instance, fields=None):
+        """Serializes `instance`, only its primary key and `fields` if given."""
+        label = instance._meta.label
+        serializer = get_dispatch_table().serializers.get(label)
+        with get_metrics().timer("drf_hooks_serialize_seconds", model=label):
+            if serializer is not None:
+                context = {"request": None}
+                serializer = serializer(instance, context=context)
+                if fields is not None:
+                    restrict_fields(serializer, instance._meta.model, fields)
+                data = serializer.data
+            else:
+                # if no user defined serializers, fallback to the django builtin!
+                data = serializers.serialize("python", [instance], fields=fields)[0]
+                data = clean_python_serialization(data)
         return data
 
+    @staticmethod
+    def serialize_models(model, instances, fields=None):
+        """Serializes many instances of `model` in a single pass."""
+        label = model._meta.label
+        serializer = get_dispatch_table().serializers.get(label)
+        with get_metrics().timer("drf_hooks_serialize_seconds", model=label):
+            if serializer is not None:
+                context = {"request": None}
+                serializer = serializer(instances, many=True, context=context)
+                if fields is not None:
+                    restrict_fields(serializer.child, model, fields)
+                return serializer.data
+            data = serializers.serialize("python", instances, fields=fields)
+            return [clean_python_serialization(item) for item in data]
+
+    @staticmethod
+    def encode_payload(payload):
+        return EncodedPayload(get_payload_encoder().encode(payload))
+
+    def render_payload(self, payload):
+        """
+        Returns the encoded `EventPayload` for this hook, restricted to its
+        `fields`, or None if the payload doesn't match its `filter` or was
+        dropped for its size (see `EventPayload.limit`).
+        """
+        if self.filter:
+            try:
+                matches = compile_filter(self.filter)(payload.data)
+            except FilterSyntaxError:
+                logger.warning("Skipped hook %s, its filter is invalid", self.pk)
+                return None
+            if not matches:
+                return None
+        return payload.encode(self.fields or None)
+
     def serialize_hook(self, payload):
-        serialized_hook = {
-            "hook": {"id": self.id, "event": self.event, "target": self.target},
-            "data": payload,
-        }
-        return json.dumps(serialized_hook, cls=DjangoJSONEncoder)
+        """
+        Returns the body for this hook. `payload` may already be encoded with
+        `encode_payload`, so that it's only encoded once for all hooks. With a
+        `content_encoding`, the body is compressed, and an encoded payload is
+        only compressed once for all hooks too. Batches are compressed whole
+        by the batcher instead.
+        """
+        if not isinstance(payload, EncodedPayload):
+            payload = self.encode_payload(payload)
+        hook = {"id": self.id, "event": self.event, "target": self.target}
+        encoder = get_payload_encoder()
+        if not self.content_encoding or self.batch_size > 1:
+            return encoder.envelope(hook, payload)
+        prefix, suffix = encoder.envelope_parts(hook)
+        return compress((prefix, payload, suffix), self.content_encoding)
+
+    def get_delivery_headers(self):
+        """The `headers` of this hook, plus the Content-Encoding of compressed bodies."""
+        if not self.content_encoding:
+            return self.headers
+        headers = dict(self.headers or {})
+        headers["Content-Encoding"] = self.content_encoding
+        return headers
+
+    def deliver_event(self, serialized_hook, debounce_key=None):
+        """
+        Calls `deliver_hook`, with `debounce_key` only for debounced events, so
+        that overrides written before it was added keep working.
+        """
+        if debounce_key and get_event_options(self.event).debounce:
+            self.deliver_hook(serialized_hook, debounce_key=debounce_key)
+        else:
+            self.deliver_hook(serialized_hook)
+
+    def deliver_hook(self, serialized_hook, debounce_key=None):
+        """
+        Deliver the payload to the target URL, or add it to the pending batch.
+        `debounce_key` identifies the object of model events, for events with a
+        `debounce` window: a delivery still waiting for the end of its window is
+        replaced by this one.
+        """
+        if self.batch_size > 1:
+            get_batcher().add(self, serialized_hook)
+            return
+        client = get_client()
+        debounce = get_event_options(self.event).debounce if debounce_key else 0
+        if debounce and hasattr(client, "debounce"):
+            client.debounce(
+                (self.pk,) + tuple(debounce_key),
+                debounce / 1000.0,
+                url=self.target,
+                data=serialized_hook,
+                headers=self.get_delivery_headers(),
+                hook_id=self.pk,
+            )
+            return
+        client.post(
+            url=self.target,
+            data=serialized_hook,
+            headers=self.get_delivery_headers(),
+            hook_id=self.pk,
+        )
+
+    async def adeliver_hook(self, serialized_hook):
+        """
+        Async counterpart of `deliver_hook`, returns once the delivery is handed
+        off. Calls `deliver_hook` in a thread if it is overridden.
+        """
+        if self.batch_size > 1 or type(self).deliver_hook is not AbstractHook.deliver_hook:
+            await sync_to_async(self.deliver_hook)(serialized_hook)
+            return
+        await get_async_client().post(
+            url=self.target,
+            data=serialized_hook,
+            headers=self.get_delivery_headers(),
+            hook_id=self.pk,
+        )
+
+    @classmethod
+    def disable_hook(cls, hook_id, reason):
+        """
+        Called when the target of a hook is gone (410) or keeps failing, see
+        settings.HOOK_DISABLE_AFTER_FAILURES. Deletes the hook; override this
+        to deactivate it and let the user know instead.
+        """
+        for hook in cls.objects.filter(pk=hook_id):
+            hook.delete()
 
-    def deliver_hook(self, serialized_hook):
-        """Deliver the payload to the target URL."""
-        get_client().post(url=self.target, data=serialized_hook, headers=self.headers)
+    @classmethod
+    def get_read_queryset(cls):
+        """
+        Returns the hooks subscribers are looked up from: those of the
+        settings.HOOK_DATABASE_ALIAS database if set, e.g. a read replica,
+        otherwise of the database the routers pick for reads.
+        """
+        alias = getattr(settings, "HOOK_DATABASE_ALIAS", None)
+        return cls.objects.using(alias) if alias else cls.objects.all()
 
     @classmethod
     def find_hooks(cls, event_name, user=None):
-        hooks = cls.objects.filter(event=event_name)
+        index = get_subscription_index()
+        if index is not None and not index.has_subscribers(event_name, user):
+            return cls.objects.none()
+        hooks = cls.get_read_queryset().filter(event=event_name)
         if not user:
             return hooks
         return hooks.filter(user=user)
 
     @classmethod
-    def find_and_fire_hooks(cls, event_name, payload, user=None):
-        for hook in cls.find_hooks(event_name, user=user):
-            serialized_hook = hook.serialize_hook(payload)
-            hook.deliver_hook(serialized_hook)
+    async def afind_hooks(cls, event_name, user=None):
+        """
+        Async counterpart of `find_hooks`, returns a list. Calls `find_hooks`
+        in a thread if it is overridden.
+        """
+        if cls.find_hooks.__func__ is not AbstractHook.find_hooks.__func__:
+
+            def find_hooks():
+                return list(cls.find_hooks(event_name, user=user).only(*cls.delivery_fields))
+
+            return await sync_to_async(find_hooks)()
+        index = get_subscription_index()
+        if index is not None and not await sync_to_async(index.has_subscribers)(event_name, user):
+            return []
+        hooks = cls.get_read_queryset().filter(event=event_name).only(*cls.delivery_fields)
+        if user:
+            hooks = hooks.filter(user=user)
+        if django.VERSION < (4, 1):
+            return await sync_to_async(list)(hooks)
+        return [hook async for hook in hooks]
+
+    @classmethod
+    def iter_hook_chunks(cls, hooks, chunk_size=None):
+        """
+        Yields the hooks of the `hooks` queryset in lists of up to `chunk_size`
+        (settings.HOOK_FANOUT_CHUNK_SIZE, 1000 by default), fetching only
+        `delivery_fields`. Chunks are read by primary key ranges, so no cursor
+        is held open in between.
+        """
+        chunk_size = chunk_size or getattr(settings, "HOOK_FANOUT_CHUNK_SIZE", 1000)
+        hooks = hooks.only(*cls.delivery_fields).order_by("pk")
+        last_pk = None
+        while True:
+            chunk = hooks if last_pk is None else hooks.filter(pk__gt=last_pk)
+            chunk = list(chunk[:chunk_size])
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_pk = chunk[-1].pk
+
+    @classmethod
+    def fire_hook_chunks(cls, chunks, payload, debounce_key=None):
+        """Delivers an `EventPayload` to the hooks, handing one chunk at a time to the client."""
+        for hooks in chunks:
+            with get_client().batch(), get_batcher().batch():
+                for hook in hooks:
+                    data = hook.render_payload(payload)
+                    if data is not None:
+                        hook.deliver_event(hook.serialize_hook(data), debounce_key)
+
+    @classmethod
+    def fan_out(cls, event_name, encoded_payload, debounce_key=None):
+        """Delivers an encoded payload to every hook of `event_name`, see `find_and_fire_hooks`."""
+        chunks = cls.iter_hook_chunks(cls.find_hooks(event_name))
+        payload = EventPayload(encoded=encoded_payload, encode=cls.encode_payload)
+        cls.fire_hook_chunks(chunks, payload, debounce_key)
+
+    @classmethod
+    def find_and_fire_hooks(cls, event_name, payload, user=None, debounce_key=None):
+        """
+        `payload` may also be a callable returning the payload, in which case it
+        is only called (once) if at least one hook is found. It's encoded once,
+        plus once per distinct `fields` of the hooks. `debounce_key` is passed
+        on to `deliver_hook`.
+
+        With settings.HOOK_DEFER_FANOUT, the hooks of events sent to all users
+        are looked up by the client instead (in a thread for the threaded
+        client, by `manage.py hooks_deliver` for the spool), so that the caller
+        doesn't wait for them however many there are.
+        """
+        metrics = get_metrics()
+        client = get_client()
+        hooks = cls.find_hooks(event_name, user=user)
+        defer = (
+            not user
+            and getattr(settings, "HOOK_DEFER_FANOUT", False)
+            and hasattr(client, "defer_fan_out")
+        )
+        with metrics.timer("drf_hooks_find_hooks_seconds", event=event_name):
+            if defer:
+                found = hooks.exists()
+            else:
+                chunks = cls.iter_hook_chunks(hooks)
+                first = next(chunks, None)
+                found = first is not None
+        if not found:
+            return
+        metrics.increment("drf_hooks_events_total", event=event_name)
+        if callable(payload):
+            payload = payload()
+        payload = EventPayload(payload, encode=cls.encode_payload)
+        with metrics.timer("drf_hooks_encode_seconds", event=event_name):
+            encoded_payload = payload.encode()
+        if encoded_payload is None:
+            # too large, see `EventPayload.limit`
+            return
+        if defer:
+            client.defer_fan_out(event_name, encoded_payload, debounce_key)
+        else:
+            chunks = itertools.chain([first], chunks)
+            cls.fire_hook_chunks(chunks, payload, debounce_key)
+
+    @classmethod
+    async def afind_and_fire_hooks(cls, event_name, payload, user=None):
+        """
+        Async counterpart of `find_and_fire_hooks`. A callable `payload` is
+        called in a thread, as serializers may query the database.
+        """
+        metrics = get_metrics()
+        with metrics.timer("drf_hooks_find_hooks_seconds", event=event_name):
+            hooks = await cls.afind_hooks(event_name, user=user)
+        if not hooks:
+            return
+        metrics.increment("drf_hooks_events_total", event=event_name)
+        if callable(payload):
+            payload = await sync_to_async(payload)()
+        payload = EventPayload(payload, encode=cls.encode_payload)
+        with metrics.timer("drf_hooks_encode_seconds", event=event_name):
+            payload.encode()
+        for hook in hooks:
+            data = hook.render_payload(payload)
+            if data is not None:
+                await hook.adeliver_hook(hook.serialize_hook(data))
+
+    @classmethod
+    def find_bulk_deliveries(cls, model, instances, action, fields=None, hooks=None):
+        """
+        Returns the (hook, serialized_hook, debounce_key) of an `action` on many
+        instances of `model`. Subscribers are looked up with a single query and
+        only the instances somebody subscribed to are serialized, restricted to
+        `fields` if given. `hooks` narrows down the subscribers, by default all
+        the hooks of the event.
+        """
+        events = get_event_lookup()
+        label = model._meta.label
+        if label not in events or action not in events[label] or not instances:
+            return []
+        event_name, all_users = events[label][action]
+        if hooks is None:
+            hooks = cls.find_hooks(event_name)
+        hooks = hooks.only(*cls.delivery_fields)
+        if all_users:
+            hooks_by_user = None
+            hooks = list(hooks)
+            targets = instances if hooks else []
+        else:
+            user_ids = [cls.get_user_id(instance) for instance in instances]
+            hooks_by_user = defaultdict(list)
+            for hook in hooks.filter(user__in=set(user_ids)):
+                hooks_by_user[hook.user_id].append(hook)
+            targets = [
+                instance
+                for instance, user_id in zip(instances, user_ids)
+                if user_id in hooks_by_user
+            ]
+        if not targets:
+            return []
+
+        deliveries = []
+        for instance, payload in zip(targets, cls.serialize_models(model, targets, fields)):
+            payload = EventPayload(payload, encode=cls.encode_payload)
+            if hooks_by_user is not None:
+                hooks = hooks_by_user[cls.get_user_id(instance)]
+            debounce_key = (label, instance.pk)
+            for hook in hooks:
+                data = hook.render_payload(payload)
+                if data is not None:
+                    deliveries.append((hook, hook.serialize_hook(data), debounce_key))
+        return deliveries
+
+    @classmethod
+    def deliver_bulk(cls, deliveries):
+        with get_client().batch(), get_batcher().batch():
+            for hook, serialized_hook, debounce_key in deliveries:
+                hook.deliver_event(serialized_hook, debounce_key)
+
+    @classmethod
+    def handle_bulk_model_event(cls, model, instances, action, fields=None):
+        deliveries = cls.find_bulk_deliveries(model, list(instances), action, fields)
+        cls.deliver_bulk(deliveries)
+
+    @classmethod
+    def get_serialization_queryset(cls, model, using=None):
+        """
+        Returns the queryset instances of `model` are fetched with before being
+        serialized by the client, from the `using` database if given, with the
+        `select_related` and `prefetch_related` lists of
+        settings.HOOK_SERIALIZATION_HINTS.
+        """
+        queryset = model._default_manager.all()
+        if using:
+            queryset = queryset.using(using)
+        hints = getattr(settings, "HOOK_SERIALIZATION_HINTS", {}).get(model._meta.label, {})
+        if hints.get("select_related"):
+            queryset = queryset.select_related(*hints["select_related"])
+        if hints.get("prefetch_related"):
+            queryset = queryset.prefetch_related(*hints["prefetch_related"])
+        return queryset
+
+    @classmethod
+    def fire_deferred_events(cls, refs):
+        """
+        Fires model events handed to the client as `EventRef`s. The instances
+        of each model are fetched with one query, from the database they were
+        saved to (a replica may not have them yet), and serialized in a single
+        pass. Instances deleted in the meantime are skipped, their deleted event
+        carries their last state.
+        """
+        groups = OrderedDict()
+        for ref in refs:
+            pks = groups.setdefault((ref.model, ref.action, ref.fields, ref.using), [])
+            if ref.pk not in pks:
+                pks.append(ref.pk)
+        for (label, action, fields, using), pks in groups.items():
+            model = apps.get_model(label)
+            using = using or router.db_for_write(model)
+            found = cls.get_serialization_queryset(model, using).in_bulk(pks)
+            instances = [found[pk] for pk in pks if pk in found]
+            if len(instances) < len(pks):
+                get_metrics().increment(
+                    "drf_hooks_deferred_missing_total", len(pks) - len(instances), model=label
+                )
+            cls.handle_bulk_model_event(model, instances, action, fields)
 
     @staticmethod
     def get_user(instance, all_users=False):
@@ -147,15 +757,63 @@ class AbstractHook(models.Model):
             raise ValueError("{} has no `user` property.".format(repr(instance)))
 
     @classmethod
-    def handle_model_event(cls, instance, action):
+    def get_user_id(cls, instance):
+        """Like `get_user`, without fetching the user if possible."""
+        if hasattr(instance, "user_id"):
+            return instance.user_id
+        return cls.get_user(instance).pk
+
+    @classmethod
+    def handle_model_event(cls, instance, action, changed=None):
+        """
+        `changed` is the set of watched fields which changed, for updated
+        events with `fields` or `delta` options (see `get_changed_fields`).
+        """
         events = get_event_lookup()
         model = instance._meta.label
+        get_metrics().increment("drf_hooks_signals_total", model=model, action=action)
         if model not in events or action not in events[model]:
             return
         event_name, all_users = events[model][action]
-        payload = cls.serialize_model(instance)
+        fields = None
+        if changed is not None:
+            if not changed:
+                # none of the watched fields changed
+                return
+            if get_event_options(event_name).delta:
+                fields = changed
+        if is_deferred(instance._state.db):
+            buffer = get_event_buffer(instance._state.db)
+            buffer.add_model_event(cls, instance, action, event_name, all_users, fields)
+            return
+        if action != "deleted" and instance.pk is not None and defers_serialization():
+            fields = None if fields is None else frozenset(fields)
+            ref = EventRef(model, instance.pk, action, fields, instance._state.db)
+            get_client().defer_events([ref])
+            return
         user = cls.get_user(instance, all_users)
-        cls.find_and_fire_hooks(event_name, payload, user)
+        if fields is None:
+            payload = partial(cls.serialize_model, instance)
+        else:
+            payload = partial(cls.serialize_model, instance, fields=fields)
+        cls.find_and_fire_hooks(event_name, payload, user, debounce_key=(model, instance.pk))
+
+    @classmethod
+    async def ahandle_model_event(cls, instance, action):
+        """Async counterpart of `handle_model_event`, without waiting for transactions."""
+        events = get_event_lookup()
+        model = instance._meta.label
+        get_metrics().increment("drf_hooks_signals_total", model=model, action=action)
+        if model not in events or action not in events[model]:
+            return
+        event_name, all_users = events[model][action]
+        if all_users:
+            user = None
+        elif hasattr(instance, "user_id"):
+            user = instance.user_id
+        else:
+            user = await sync_to_async(cls.get_user_id)(instance)
+        await cls.afind_and_fire_hooks(event_name, partial(cls.serialize_model, instance), user)
 
     def __unicode__(self):
         return "{} => {}".format(self.event, self.target)
@@ -166,6 +824,38 @@ class Hook(AbstractHook):
         swappable = "HOOK_CUSTOM_MODEL"
 
 
+class Delivery(models.Model):
+    """
+    A delivery waiting in the outbox, see `drf_hooks.outbox`.
+    """
+
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (DONE, "Done"), (FAILED, "Failed")]
+
+    id = models.BigAutoField(primary_key=True)
+    created = models.DateTimeField(auto_now_add=True)
+    hook_id = models.BigIntegerField(null=True, blank=True)
+    target = models.URLField("Target URL", max_length=255)
+    headers = models.JSONField(default=get_default_headers)
+    body = models.BinaryField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "deliveries"
+        indexes = [
+            models.Index(fields=["status", "next_attempt"], name="drf_hooks_delivery_due_idx"),
+        ]
+
+    def __unicode__(self):
+        return "{} ({})".format(self.target, self.status)
+
+
 ##############
 ### EVENTS ###
 ##############
@@ -177,20 +867,89 @@ def custom_event(sender, instance, action, *args, **kwargs):
     get_hook_model().handle_model_event(instance, action)
 
 
-@receiver(post_save, dispatch_uid="instance-saved-hook")
-def model_saved(sender, instance, created, *args, **kwargs):
+_suppressed = threading.local()
+
+
+@contextmanager
+def suppress_hooks(model):
+    """Ignores the save and delete signals of `model` within this block."""
+    suppressed = getattr(_suppressed, "models", frozenset())
+    _suppressed.models = suppressed | {model}
+    try:
+        yield
+    finally:
+        _suppressed.models = suppressed
+
+
+def is_suppressed(model):
+    return model in getattr(_suppressed, "models", ())
+
+
+def model_initialized(sender, instance, *args, **kwargs):
+    """Snapshots the watched fields of instances, see `DispatchTable.track`."""
+    take_snapshot(instance)
+
+
+def model_saved(sender, instance, created, update_fields=None, *args, **kwargs):
     """Automatically triggers "created" and "updated" actions."""
-    action = "created" if created else "updated"
-    get_hook_model().handle_model_event(instance, action)
+    if not is_suppressed(sender):
+        if created:
+            get_hook_model().handle_model_event(instance, "created")
+        else:
+            changed = get_changed_fields(instance, update_fields)
+            get_hook_model().handle_model_event(instance, "updated", changed=changed)
+    take_snapshot(instance, update_fields)
 
 
-@receiver(post_delete, dispatch_uid="instance-deleted-hook")
 def model_deleted(sender, instance, *args, **kwargs):
     """Automatically triggers "deleted" actions."""
+    if is_suppressed(sender):
+        return
     get_hook_model().handle_model_event(instance, "deleted")
 
 
+@receiver(setting_changed, dispatch_uid="hook-settings-changed")
+def hook_settings_changed(sender, setting, *args, **kwargs):
+    """Recompiles the dispatch table when the hook settings are changed."""
+    if setting in ("HOOK_EVENTS", "HOOK_SERIALIZERS"):
+        clear_event_lookup()
+        compile_dispatch_table()
+
+
 @receiver(raw_hook_event, dispatch_uid="raw-custom-hook")
 def raw_custom_event(sender, event_name, payload, user, **kwargs):
     """Give a full payload"""
-    get_hook_model().find_and_fire_hooks(event_name, payload, user)
+    hook_model = get_hook_model()
+    if is_deferred(DEFAULT_DB_ALIAS):
+        get_event_buffer(DEFAULT_DB_ALIAS).add_raw_event(hook_model, event_name, payload, user)
+        return
+    hook_model.find_and_fire_hooks(event_name, payload, user)
+
+
+async def afire_hook_event(instance, action):
+    """Async counterpart of sending `hook_event`, for code running in an event loop."""
+    await get_hook_model().ahandle_model_event(instance, action)
+
+
+async def afire_raw_hook_event(event_name, payload, user=None):
+    """Async counterpart of sending `raw_hook_event`, for code running in an event loop."""
+    await get_hook_model().afind_and_fire_hooks(event_name, payload, user)
+
+
+HOOK_MODEL_LABEL = getattr(settings, "HOOK_CUSTOM_MODEL", "drf_hooks.Hook")
+
+
+@receiver(post_save, sender=HOOK_MODEL_LABEL, dispatch_uid="hook-saved-index")
+def hook_saved(sender, instance, *args, **kwargs):
+    """Keeps the subscription index in sync with the hooks table."""
+    index = get_subscription_index()
+    if index is not None:
+        index.hook_saved(instance)
+
+
+@receiver(post_delete, sender=HOOK_MODEL_LABEL, dispatch_uid="hook-deleted-index")
+def hook_deleted(sender, instance, *args, **kwargs):
+    """Keeps the subscription index in sync with the hooks table."""
+    index = get_subscription_index()
+    if index is not None:
+        index.hook_deleted(instance)
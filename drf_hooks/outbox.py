@@ -0,0 +1,243 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .client import build_session, get_timeout
+from .metrics import get_metrics
+from .models import Delivery
+from .retry import GIVE_UP, RETRY, SUCCESS, DeliveryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxClient(object):
+    """
+    Writes deliveries to the outbox table instead of sending them, to be
+    delivered by `manage.py hooks_worker`. Deliveries made within a `batch`
+    are inserted together. Used when settings.HOOK_OUTBOX is True.
+
+    The rows are written in the transaction of the event, so they are only
+    delivered if it commits.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        pending = getattr(self.local, "pending", None)
+        if pending is not None:
+            yield
+            return
+        self.local.pending = []
+        try:
+            yield
+            self.save(self.local.pending)
+        finally:
+            self.local.pending = None
+
+    def save(self, deliveries):
+        if deliveries:
+            Delivery.objects.bulk_create(deliveries)
+
+    def request(self, method, url, data=b"", headers=None, hook_id=None, **kwargs):
+        if method != "post":
+            raise ValueError("The outbox only supports POST requests")
+        if isinstance(data, str):
+            data = data.encode()
+        delivery = Delivery(target=url, body=data, headers=headers or {}, hook_id=hook_id)
+        pending = getattr(self.local, "pending", None)
+        if pending is None:
+            self.save([delivery])
+        else:
+            pending.append(delivery)
+
+    def post(self, *args, **kwargs):
+        self.request("post", *args, **kwargs)
+
+
+class OutboxWorker(object):
+    """
+    Claims batches of due deliveries from the outbox and sends them
+    concurrently. Any number of workers can drain the same outbox: rows are
+    claimed with SELECT ... FOR UPDATE SKIP LOCKED where the database supports
+    it, or with a conditional UPDATE otherwise, and a claim expires after
+    `lease` seconds so that the rows of a crashed worker are picked up again.
+    The lease is renewed every `lease / 2` seconds while a batch is being
+    sent, and rows are only updated afterwards if they're still claimed by
+    this worker, so a slow batch is never delivered twice.
+
+    Delivered rows are deleted, or marked as done if `purge` is False. Failed
+    rows are retried according to the `DeliveryPolicy` and marked as failed
+    once it gives up. Rows for hosts whose circuit is open are put back
+    without being attempted.
+    """
+
+    def __init__(
+        self,
+        batch_size=100,
+        concurrency=10,
+        lease=60,
+        purge=True,
+        session=None,
+        timeout=None,
+        policy=None,
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.lease = lease
+        self.purge = purge
+        self.session = session or build_session()
+        self.timeout = timeout or get_timeout()
+        self.policy = policy or DeliveryPolicy.from_settings()
+        self.using = router.db_for_write(Delivery)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    @classmethod
+    def from_settings(cls, **kwargs):
+        options = {
+            "batch_size": getattr(settings, "HOOK_OUTBOX_BATCH_SIZE", 100),
+            "concurrency": getattr(settings, "HOOK_OUTBOX_CONCURRENCY", 10),
+            "lease": getattr(settings, "HOOK_OUTBOX_LEASE", 60),
+            "purge": getattr(settings, "HOOK_OUTBOX_PURGE", True),
+        }
+        options.update((k, v) for k, v in kwargs.items() if v is not None)
+        return cls(**options)
+
+    def due(self, now):
+        return Delivery.objects.using(self.using).filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+            status=Delivery.PENDING,
+            next_attempt__lte=now,
+        )
+
+    def claim(self):
+        """Claims a batch of due deliveries for this worker and returns them."""
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        claimed_until = now + timedelta(seconds=self.lease)
+        due = self.due(now).order_by("next_attempt", "id")
+        if connections[self.using].features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=self.using):
+                ids = list(
+                    due.select_for_update(skip_locked=True).values_list("id", flat=True)[
+                        : self.batch_size
+                    ]
+                )
+                Delivery.objects.using(self.using).filter(id__in=ids).update(
+                    claimed_by=token, claimed_until=claimed_until
+                )
+        else:
+            # no row locks, only the first worker to update a row gets it
+            ids = list(due.values_list("id", flat=True)[: self.batch_size])
+            self.due(now).filter(id__in=ids).update(claimed_by=token, claimed_until=claimed_until)
+        return list(Delivery.objects.using(self.using).filter(claimed_by=token).order_by("id"))
+
+    def send(self, delivery):
+        """
+        Attempts a delivery, returns the policy outcome (or None if it wasn't
+        attempted) and the delay before it may be attempted again.
+        """
+        host = urlsplit(delivery.target).netloc
+        if not self.policy.allow(host):
+            return None, self.policy.breaker.retry_after(host)
+        try:
+            with get_metrics().timer("drf_hooks_deliver_seconds", host=host):
+                response = self.session.post(
+                    delivery.target,
+                    data=bytes(delivery.body),
+                    headers=delivery.headers,
+                    timeout=self.timeout,
+                )
+        except requests.RequestException as e:
+            outcome = self.policy.outcome(delivery.hook_id, host, delivery.attempts, exception=e)
+            return outcome, self.policy.get_delay(delivery.attempts)
+        outcome = self.policy.outcome(delivery.hook_id, host, delivery.attempts, response=response)
+        return outcome, self.policy.get_delay(delivery.attempts, response)
+
+    def run_once(self):
+        """Delivers one batch, returns the number of deliveries it contained."""
+        deliveries = self.claim()
+        if not deliveries:
+            return 0
+        token = deliveries[0].claimed_by
+        futures = [self.executor.submit(self.send, delivery) for delivery in deliveries]
+        pending = futures
+        while pending:
+            pending = wait(pending, timeout=self.lease / 2.0).not_done
+            if pending:
+                self.renew(token)
+        done, failed, later = [], [], []
+        now = timezone.now()
+        for delivery, future in zip(deliveries, futures):
+            outcome, delay = future.result()
+            if outcome == SUCCESS:
+                done.append(delivery.id)
+                continue
+            if outcome == GIVE_UP:
+                failed.append(delivery.id)
+                continue
+            if outcome == RETRY:
+                delivery.attempts += 1
+            delivery.next_attempt = now + timedelta(seconds=delay)
+            later.append(delivery)
+        self.complete(done, token)
+        self.fail(failed, token)
+        self.retry(later, token)
+        return len(deliveries)
+
+    def claimed(self, token):
+        """The rows still claimed with `token`, the claim may have expired and been taken over."""
+        return Delivery.objects.using(self.using).filter(claimed_by=token)
+
+    def renew(self, token):
+        claimed_until = timezone.now() + timedelta(seconds=self.lease)
+        self.claimed(token).update(claimed_until=claimed_until)
+
+    def complete(self, ids, token):
+        deliveries = self.claimed(token).filter(id__in=ids)
+        if self.purge:
+            deliveries.delete()
+        else:
+            deliveries.update(status=Delivery.DONE, claimed_by="", claimed_until=None)
+
+    def fail(self, ids, token):
+        self.claimed(token).filter(id__in=ids).update(
+            attempts=F("attempts") + 1, status=Delivery.FAILED, claimed_by="", claimed_until=None
+        )
+
+    def retry(self, deliveries, token):
+        for delivery in deliveries:
+            delivery.claimed_by = ""
+            delivery.claimed_until = None
+        # bulk_update keeps the filters of the queryset
+        self.claimed(token).bulk_update(
+            deliveries, ["attempts", "next_attempt", "claimed_by", "claimed_until"]
+        )
+
+    def run(self, poll_interval=1, stop=None):
+        """Delivers batches until `stop` is set, sleeping when the outbox is empty."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            if not self.run_once():
+                stop.wait(poll_interval)
+        self.executor.shutdown()
+
+    def drain(self):
+        """Delivers batches until nothing is due anymore."""
+        total = 0
+        while True:
+            count = self.run_once()
+            if not count:
+                return total
+            total += count
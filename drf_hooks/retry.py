@@ -0,0 +1,180 @@
+import asyncio
+import collections
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+SUCCESS = "success"
+RETRY = "retry"
+GIVE_UP = "give_up"
+
+RETRY_STATUS_CODES = frozenset([408, 425, 429, 500, 502, 503, 504])
+
+
+class CircuitBreaker(object):
+    """
+    Counts the consecutive failures per target host. Once a host reaches
+    `threshold` failures, the circuit opens and deliveries to it are short
+    circuited for `reset_timeout` seconds, after which a single trial delivery
+    is let through to decide whether to close it again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = collections.Counter()
+        self.opened = {}
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        """Whether a delivery to `host` may be attempted now."""
+        if not self.threshold:
+            return True
+        with self.lock:
+            opened = self.opened.get(host)
+            if opened is None:
+                return True
+            if time.monotonic() - opened < self.reset_timeout:
+                return False
+            # half open: let this one through and hold back the others
+            self.opened[host] = time.monotonic()
+            return True
+
+    def retry_after(self, host):
+        """Seconds until the circuit of `host` lets a delivery through again."""
+        opened = self.opened.get(host)
+        if opened is None:
+            return 0
+        return max(0, self.reset_timeout - (time.monotonic() - opened))
+
+    def success(self, host):
+        with self.lock:
+            self.failures.pop(host, None)
+            self.opened.pop(host, None)
+
+    def failure(self, host):
+        if not self.threshold:
+            return
+        with self.lock:
+            self.failures[host] += 1
+            if self.failures[host] >= self.threshold:
+                if host not in self.opened:
+                    logger.warning("Too many failed deliveries to %s, pausing deliveries", host)
+                self.opened[host] = time.monotonic()
+
+
+class DeliveryPolicy(object):
+    """
+    Decides what happens after a delivery attempt: transport errors, 408, 429
+    and 5xx responses are retried up to `max_retries` times with jittered
+    exponential backoff, while the other 4xx responses are not. A hook whose
+    target answers 410 Gone, or which failed `disable_after` deliveries in a
+    row, is disabled with `AbstractHook.disable_hook`.
+    """
+
+    def __init__(
+        self,
+        max_retries=3,
+        backoff=1,
+        backoff_max=300,
+        breaker_threshold=5,
+        breaker_timeout=30,
+        disable_after=None,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_timeout)
+        self.disable_after = disable_after
+        self.hook_failures = collections.Counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_retries=getattr(settings, "HOOK_MAX_RETRIES", 3),
+            backoff=getattr(settings, "HOOK_RETRY_BACKOFF", 1),
+            backoff_max=getattr(settings, "HOOK_RETRY_BACKOFF_MAX", 300),
+            breaker_threshold=getattr(settings, "HOOK_CIRCUIT_BREAKER_THRESHOLD", 5),
+            breaker_timeout=getattr(settings, "HOOK_CIRCUIT_BREAKER_TIMEOUT", 30),
+            disable_after=getattr(settings, "HOOK_DISABLE_AFTER_FAILURES", None),
+        )
+
+    def get_delay(self, attempt, response=None):
+        """Seconds to wait before retrying after `attempt` (0 based) failed."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+        retry_after = response is not None and response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.backoff_max, int(retry_after)))
+        return delay
+
+    def allow(self, host):
+        return self.breaker.allow(host)
+
+    def outcome(self, hook_id, host, attempt, response=None, exception=None):
+        """Records the result of a delivery attempt and returns what to do next."""
+        status = "error" if exception is not None else response.status_code
+        get_metrics().increment("drf_hooks_responses_total", host=host, status=status)
+        if exception is None and response.status_code < 400:
+            self.breaker.success(host)
+            if hook_id is not None:
+                with self.lock:
+                    self.hook_failures.pop(hook_id, None)
+            return SUCCESS
+
+        if exception is not None:
+            logger.warning("Failed to deliver hook to %s: %s", host, exception)
+        else:
+            logger.warning("Failed to deliver hook to %s: %s", host, response.status_code)
+
+        if response is not None and response.status_code == 410:
+            # the target asked us to stop
+            self.breaker.success(host)
+            self.disable(hook_id, "410 Gone")
+            return GIVE_UP
+        retryable = (
+            exception is not None
+            or response is not None
+            and response.status_code in RETRY_STATUS_CODES
+        )
+        if retryable:
+            self.breaker.failure(host)
+        else:
+            # the target is up, it just doesn't want this one
+            self.breaker.success(host)
+        if retryable and attempt < self.max_retries:
+            return RETRY
+        return self.give_up(hook_id, host)
+
+    def give_up(self, hook_id, host):
+        logger.warning("Giving up delivering hook to %s", host)
+        if hook_id is not None and self.disable_after:
+            with self.lock:
+                self.hook_failures[hook_id] += 1
+                failures = self.hook_failures[hook_id]
+            if failures >= self.disable_after:
+                self.disable(hook_id, "%d failed deliveries" % failures)
+        return GIVE_UP
+
+    def disable(self, hook_id, reason):
+        if hook_id is None:
+            return
+        from .models import get_hook_model
+
+        with self.lock:
+            self.hook_failures.pop(hook_id, None)
+        logger.warning("Disabling hook %s: %s", hook_id, reason)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            get_hook_model().disable_hook(hook_id, reason)
+        else:
+            # called by the AsyncClient, don't block the event loop on the database
+            loop.run_in_executor(None, get_hook_model().disable_hook, hook_id, reason)
@@ -1,6 +1,8 @@
 from django.conf import settings
 from rest_framework import serializers
 
+from drf_hooks.encoders import get_content_encodings
+from drf_hooks.filters import FilterSyntaxError, compile_filter
 from drf_hooks.models import get_hook_model
 
 
@@ -9,6 +11,28 @@ class HookSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     headers = serializers.JSONField(write_only=True, required=False)
 
+    def validate_filter(self, value):
+        if value:
+            try:
+                compile_filter(value)
+            except FilterSyntaxError as e:
+                raise serializers.ValidationError(str(e))
+        return value
+
+    def validate_fields(self, value):
+        if value is not None and (
+            not isinstance(value, list) or not all(isinstance(name, str) for name in value)
+        ):
+            raise serializers.ValidationError("Fields must be a list of field names.")
+        return value
+
+    def validate_content_encoding(self, value):
+        if value and value not in get_content_encodings():
+            raise serializers.ValidationError(
+                "zstd requires the zstandard package to be installed."
+            )
+        return value
+
     def create(self, validated_data):
         """Recreating identical hooks fails silently"""
         obj, created = get_hook_model().objects.get_or_create(**validated_data)
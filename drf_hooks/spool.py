@@ -0,0 +1,337 @@
+import itertools
+import logging
+import os
+import pickle
+import signal
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .client import AdaptiveConcurrency, Client, DeliveryQueue
+from .deferred import EventRef
+from .encoders import EncodedPayload
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_name(pid=None):
+    """The name under which the worker process `pid` claims its files."""
+    return "%s-%d" % (socket.gethostname(), os.getpid() if pid is None else pid)
+
+
+def is_worker_alive(name):
+    """
+    Whether the worker `name` may still be running. The processes of other
+    hosts, and names which aren't those of a worker, can't be checked.
+    """
+    host, _, pid = name.rpartition("-")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # somebody else's process
+        pass
+    return True
+
+
+class Spool(object):
+    """
+    A spool directory, used to hand deliveries from the web processes over to
+    `manage.py hooks_deliver` on the same host. Files are written to `tmp/`
+    and renamed to `new/` once complete. A worker claims a file by renaming it
+    into its own directory under `cur/`, and deletes it once all its
+    deliveries are done, so the files of a worker which died are put back in
+    `new/` when it is restarted, or when the workers are started again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.sequence = itertools.count()
+        for name in ("tmp", "new", "cur"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def write(self, deliveries):
+        # the time first, so that listing the files returns them in order
+        name = "%020d-%s-%d-%d-%d.hooks" % (
+            time.time_ns(),
+            socket.gethostname(),
+            os.getpid(),
+            threading.get_ident(),
+            next(self.sequence),
+        )
+        path = os.path.join(self.directory, "tmp", name)
+        with open(path, "wb") as f:
+            pickle.dump(deliveries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(path, os.path.join(self.directory, "new", name))
+
+    def claim(self, worker, limit):
+        """Moves up to `limit` files to the directory of `worker`, returns their paths."""
+        claimed_dir = os.path.join(self.directory, "cur", worker)
+        os.makedirs(claimed_dir, exist_ok=True)
+        new_dir = os.path.join(self.directory, "new")
+        paths = []
+        for name in sorted(os.listdir(new_dir)):
+            path = os.path.join(claimed_dir, name)
+            try:
+                os.rename(os.path.join(new_dir, name), path)
+            except FileNotFoundError:
+                # claimed by another worker
+                continue
+            paths.append(path)
+            if len(paths) >= limit:
+                break
+        return paths
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def done(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # put back by `recover` in the meantime
+            pass
+
+    def recover(self, workers=None):
+        """Puts the files claimed by `workers` (by default all of them) back in `new/`."""
+        cur_dir = os.path.join(self.directory, "cur")
+        for worker in os.listdir(cur_dir) if workers is None else workers:
+            claimed_dir = os.path.join(cur_dir, worker)
+            if not os.path.isdir(claimed_dir):
+                continue
+            for name in os.listdir(claimed_dir):
+                os.rename(
+                    os.path.join(claimed_dir, name), os.path.join(self.directory, "new", name)
+                )
+            os.rmdir(claimed_dir)
+
+    def recover_dead(self, workers=None):
+        """
+        Like `recover`, for those of `workers` (by default all of them) whose
+        process is known to be dead, so that the files of the workers of
+        another `hooks_deliver` running at the same time are left alone.
+        """
+        if workers is None:
+            workers = os.listdir(os.path.join(self.directory, "cur"))
+        self.recover([worker for worker in workers if not is_worker_alive(worker)])
+
+
+class SpoolClient(object):
+    """
+    Writes deliveries to a spool directory instead of sending them, to be
+    delivered by `manage.py hooks_deliver`. Used when settings.HOOK_SPOOL_DIR
+    is set. The deliveries made within a `batch` are written to a single file,
+    so firing an event costs the web process one small write.
+    """
+
+    def __init__(self, directory):
+        self.spool = Spool(directory)
+        self.local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        pending = getattr(self.local, "pending", None)
+        if pending is not None:
+            yield
+            return
+        self.local.pending = []
+        try:
+            yield
+            if self.local.pending:
+                self.spool.write(self.local.pending)
+        finally:
+            self.local.pending = None
+
+    def request(self, method, url, data=b"", headers=None, hook_id=None, debounce=None, **kwargs):
+        if method != "post":
+            raise ValueError("The spool only supports POST requests")
+        delivery = {"url": url, "data": data, "headers": headers or {}, "hook_id": hook_id}
+        if debounce is not None:
+            delivery["debounce"] = debounce
+        pending = getattr(self.local, "pending", None)
+        if pending is None:
+            self.spool.write([delivery])
+        else:
+            pending.append(delivery)
+
+    def post(self, *args, **kwargs):
+        self.request("post", *args, **kwargs)
+
+    def debounce(self, key, delay, **kwargs):
+        """Leaves debouncing to the workers, each of them debounces the deliveries it reads."""
+        self.request("post", debounce=(key, delay), **kwargs)
+
+    def defer_fan_out(self, event_name, encoded_payload, debounce_key=None):
+        """Leaves looking up the hooks of `event_name` to the workers."""
+        task = {"fan_out": event_name, "data": bytes(encoded_payload)}
+        if debounce_key is not None:
+            task["debounce_key"] = debounce_key
+        self.defer(task)
+
+    def defer_events(self, refs):
+        """Leaves serializing model events to the workers, see `EventRef`."""
+        self.defer({"events": [tuple(ref) for ref in refs]})
+
+    def defer(self, task):
+        pending = getattr(self.local, "pending", None)
+        if pending is None:
+            self.spool.write([task])
+        else:
+            pending.append(task)
+
+
+class SpoolWorker(Client):
+    """
+    Delivers the files of a spool with a pool of up to `concurrency` threads.
+    The deliveries in flight per target host are limited by an
+    `AdaptiveConcurrency`, so fast targets get more threads and struggling
+    ones fewer. At most `max_pending` deliveries are read into memory at once.
+    """
+
+    def __init__(
+        self,
+        spool,
+        concurrency=32,
+        max_pending=None,
+        session=None,
+        timeout=None,
+        policy=None,
+        limiter=None,
+    ):
+        self.spool = spool
+        self.name = get_worker_name()
+        self.limiter = limiter or AdaptiveConcurrency(max_limit=concurrency)
+        self.max_pending = max_pending or concurrency * 10
+        queue = DeliveryQueue(limiter=self.limiter)
+        super().__init__(
+            num_threads=concurrency, session=session, timeout=timeout, queue=queue, policy=policy
+        )
+        self.pending = {}
+        self.files = {}
+        self.pending_lock = threading.Condition()
+
+    @classmethod
+    def from_settings(cls, **kwargs):
+        options = {
+            "concurrency": getattr(settings, "HOOK_SPOOL_CONCURRENCY", 32),
+            "max_pending": getattr(settings, "HOOK_SPOOL_MAX_PENDING", None),
+        }
+        options.update((k, v) for k, v in kwargs.items() if v is not None)
+        spool = Spool(settings.HOOK_SPOOL_DIR)
+        limiter = AdaptiveConcurrency(
+            initial=getattr(settings, "HOOK_MAX_PER_HOST", 2),
+            max_limit=options["concurrency"],
+            target_latency=getattr(settings, "HOOK_SPOOL_TARGET_LATENCY", 1.0),
+        )
+        return cls(spool, limiter=limiter, **options)
+
+    def in_flight(self):
+        with self.pending_lock:
+            return len(self.files)
+
+    def run_once(self):
+        """Claims and queues files while there is room, returns the number of deliveries."""
+        count = 0
+        while self.in_flight() < self.max_pending:
+            paths = self.spool.claim(self.name, limit=10)
+            if not paths:
+                break
+            for path in paths:
+                count += self.load(path)
+        return count
+
+    def load(self, path):
+        deliveries = self.spool.read(path)
+        # deferred by `SpoolClient.defer`, all other entries are deliveries
+        tasks = [delivery for delivery in deliveries if "url" not in delivery]
+        if tasks:
+            self.run_tasks(tasks)
+            deliveries = [delivery for delivery in deliveries if "url" in delivery]
+        if not deliveries:
+            self.spool.done(path)
+            return len(tasks)
+        with self.pending_lock:
+            self.pending[path] = len(deliveries)
+        with self.batch():
+            for delivery in deliveries:
+                # retries reuse this dict, so it identifies the delivery until it's done
+                kwargs = dict(delivery)
+                debounce = kwargs.pop("debounce", None)
+                with self.pending_lock:
+                    self.files[id(kwargs)] = (kwargs, path)
+                if debounce is None:
+                    self.queue.put(("post", (), kwargs, 0))
+                else:
+                    self.enqueue_debounced(debounce[0], debounce[1], ("post", (), kwargs, 0))
+        return len(deliveries) + len(tasks)
+
+    def run_tasks(self, tasks):
+        """
+        Looks up the hooks of the events whose fan-out or serialization was
+        left to the workers. Their deliveries are written back to the spool,
+        one file per chunk, so that all the workers share them.
+        """
+        from .models import get_hook_model
+
+        hook_model = get_hook_model()
+        for task in tasks:
+            try:
+                if "events" in task:
+                    hook_model.fire_deferred_events([EventRef(*ref) for ref in task["events"]])
+                else:
+                    hook_model.fan_out(
+                        task["fan_out"], EncodedPayload(task["data"]), task.get("debounce_key")
+                    )
+            except Exception:
+                logger.exception("Failed to fire deferred hooks")
+
+    def finish(self, item, outcome):
+        with self.pending_lock:
+            kwargs, path = self.files.pop(id(item[2]))
+            self.pending[path] -= 1
+            if self.pending[path]:
+                return
+        # before `drain` returns
+        self.spool.done(path)
+        with self.pending_lock:
+            del self.pending[path]
+            self.pending_lock.notify_all()
+
+    def run(self, poll_interval=0.5, stop=None, grace=30):
+        """
+        Delivers until `stop` is set, then waits up to `grace` seconds for the
+        deliveries in flight. The files of the deliveries which are still
+        pending after that are delivered again when the workers restart.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            if not self.run_once():
+                stop.wait(poll_interval)
+        if not self.drain(timeout=grace):
+            discarded = self.queue.clear()
+            logger.warning("Stopped with %d deliveries left, they will be retried", discarded)
+        self.spool.recover([self.name])
+
+    def drain(self, timeout=None):
+        """Waits until the claimed deliveries are done, returns False on timeout."""
+        with self.pending_lock:
+            return self.pending_lock.wait_for(lambda: not self.pending, timeout=timeout)
+
+
+def run_worker(concurrency=None, poll_interval=0.5, grace=30):
+    """Entry point of the processes started by `manage.py hooks_deliver`."""
+    import django
+
+    django.setup()
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+    worker = SpoolWorker.from_settings(concurrency=concurrency)
+    worker.run(poll_interval=poll_interval, stop=stop, grace=grace)
@@ -1,8 +1,11 @@
+from django.urls import path
 from rest_framework import routers
 
-from .views import HookViewSet
+from .views import HookViewSet, MetricsView
 
 router = routers.SimpleRouter()
 router.register(r"webhooks", HookViewSet, "webhook")
 
-urlpatterns = router.urls
+urlpatterns = [
+    path("webhooks/metrics/", MetricsView.as_view(), name="webhook-metrics"),
+] + router.urls
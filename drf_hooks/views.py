@@ -1,5 +1,9 @@
-from rest_framework import viewsets
+from django.db import router
+from django.http import HttpResponse
+from rest_framework import permissions, viewsets
+from rest_framework.views import APIView
 
+from .metrics import collect, render_prometheus
 from .models import get_hook_model
 from .serializers import HookSerializer
 
@@ -11,3 +15,18 @@ class HookViewSet(viewsets.ModelViewSet):
     model = get_hook_model()
     serializer_class = HookSerializer
     # permission_classes = (CustomDjangoModelPermissions,)
+
+    def get_queryset(self):
+        # read hooks from where they are written, not from a lagging replica
+        return super().get_queryset().using(router.db_for_write(self.model))
+
+
+class MetricsView(APIView):
+    """Delivery metrics of all processes, in the Prometheus text format."""
+
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            render_prometheus(collect()), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
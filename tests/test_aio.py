@@ -0,0 +1,130 @@
+import asyncio
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django_comments.models import Comment
+
+from drf_hooks.models import Hook, afire_hook_event, afire_raw_hook_event
+from drf_hooks.retry import GIVE_UP, SUCCESS, DeliveryPolicy
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.post = MagicMock(side_effect=self.record)
+        self.calls = []
+
+    async def record(self, **kwargs):
+        self.calls.append(kwargs)
+
+
+@pytest.fixture
+def async_client(mocker):
+    client = FakeAsyncClient()
+    mocker.patch("drf_hooks.models.get_async_client", return_value=client)
+    return client
+
+
+class TestAsync:
+    def test_afind_and_fire_hooks(self, db, async_client, mocker):
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        hook = Hook.objects.create(user=user, event="special.thing", target="http://a.com/1")
+        async_to_sync(afire_raw_hook_event)("special.thing", {"hello": "world!"}, user)
+
+        assert 1 == len(async_client.calls)
+        call = async_client.calls[0]
+        assert hook.pk == call["hook_id"]
+        assert {"hello": "world!"} == json.loads(call["data"])["data"]
+        assert [] == async_to_sync(Hook.afind_hooks)("comment.added", user)
+        # querysets only support `async for` on Django 4.1+
+        mocker.patch("django.VERSION", (4, 0, 0, "final", 0))
+        assert [hook] == async_to_sync(Hook.afind_hooks)("special.thing", user)
+
+    def test_afire_hook_event(self, db, async_client):
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        Hook.objects.create(user=user, event="comment.moderated", target="http://a.com/1")
+        site = Site.objects.get_current()
+        comment = Comment.objects.create(site=site, content_object=user, user=user, comment="Hi")
+        async_to_sync(afire_hook_event)(comment, "moderated")
+
+        payload = json.loads(async_client.calls[0]["data"])
+        assert "comment.moderated" == payload["hook"]["event"]
+        assert "Hi" == payload["data"]["comment"]
+
+    def test_overrides(self, db, async_client, mocker):
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        for name in ("active", "inactive"):
+            Hook.objects.create(user=user, event="special.thing", target="http://a.com/" + name)
+        find_hooks = Hook.find_hooks.__func__
+
+        def find_active_hooks(cls, event_name, user=None):
+            return find_hooks(cls, event_name, user=user).exclude(target__endswith="inactive")
+
+        mocker.patch.object(Hook, "find_hooks", classmethod(find_active_hooks))
+        async_to_sync(afire_raw_hook_event)("special.thing", {"hello": "world!"}, user)
+        assert ["http://a.com/active"] == [call["url"] for call in async_client.calls]
+
+        delivered = []
+        mocker.patch.object(Hook, "deliver_hook", lambda self, body: delivered.append(self.target))
+        async_to_sync(afire_raw_hook_event)("special.thing", {"hello": "world!"}, user)
+        assert ["http://a.com/active"] == delivered
+        assert 1 == len(async_client.calls)
+
+
+class TestAsyncClient:
+    def test_deliveries(self):
+        httpx = pytest.importorskip("httpx")
+        from drf_hooks.aio import AsyncClient
+
+        statuses = {"a.com": [503, 200], "b.com": [404]}
+        in_flight = []
+
+        async def handler(request):
+            in_flight.append(request.url.host)
+            await asyncio.sleep(0.01)
+            return httpx.Response(statuses[request.url.host].pop(0))
+
+        async def run():
+            http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            client = AsyncClient(
+                max_per_host=1, http=http, policy=DeliveryPolicy(max_retries=1, backoff=0)
+            )
+            tasks = [
+                await client.post(url="http://a.com/hooks", data=b"{}", headers={}),
+                await client.post(url="http://b.com/hooks", data=b"{}", headers={}),
+            ]
+            await client.aclose()
+            return [task.result() for task in tasks]
+
+        assert [SUCCESS, GIVE_UP] == asyncio.run(run())
+        assert 3 == len(in_flight)
+
+    def test_unlimited(self):
+        httpx = pytest.importorskip("httpx")
+        from drf_hooks.aio import AsyncClient
+
+        async def run():
+            http = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(200)))
+            client = AsyncClient(max_per_host=0, http=http, policy=DeliveryPolicy(max_retries=0))
+            task = await client.post(url="http://a.com/hooks", data=b"{}", headers={})
+            await client.aclose()
+            return task.result()
+
+        assert SUCCESS == asyncio.run(run())
+
+    def test_open_circuit(self, mocker):
+        pytest.importorskip("httpx")
+        from drf_hooks.aio import AsyncClient
+
+        policy = DeliveryPolicy(max_retries=0, breaker_threshold=1, disable_after=1)
+        policy.breaker.failure("a.com")
+        disable = mocker.patch.object(policy, "disable")
+        client = AsyncClient(http=MagicMock(), policy=policy)
+        outcome, delay = asyncio.run(client.send("http://a.com/hooks", b"{}", {}, 1, 0))
+        # held back without using up an attempt, nor counting against the hook
+        assert outcome is None and 29 < delay <= 30
+        assert not client.http.post.called
+        assert not disable.called and not policy.hook_failures
@@ -0,0 +1,357 @@
+import json
+import os
+import signal
+import threading
+import time
+from unittest.mock import MagicMock
+
+import requests
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.db import transaction
+from django_comments.models import Comment
+
+from drf_hooks import client as client_module
+from drf_hooks.client import (
+    Client,
+    DeliveryQueue,
+    SyncClient,
+    build_session,
+    drain,
+    install_sigterm_handler,
+)
+from drf_hooks.models import Hook
+from drf_hooks.retry import GIVE_UP, RETRY, SUCCESS, DeliveryPolicy
+
+
+def make_session(status_code=200):
+    session = MagicMock()
+    session.post.return_value.status_code = status_code
+    session.post.return_value.headers = {}
+    return session
+
+
+class TestClient:
+    def test_sessions_are_reused(self, settings):
+        settings.HOOK_TIMEOUT = (1, 2)
+        session = make_session()
+        client = Client(num_threads=2, session=session)
+        for batch in range(3):
+            client.post(url="http://example.com/%d" % batch, data=b"{}")
+            for thread in client.flush_threads:
+                thread.join()
+
+        assert 3 == client.total_sent
+        assert 3 == session.post.call_count
+        assert (1, 2) == session.post.call_args[1]["timeout"]
+
+    def test_failures_dont_stop_the_flush(self):
+        session = make_session()
+        session.post.side_effect = [requests.ConnectTimeout, MagicMock(status_code=200)]
+        client = Client(num_threads=1, session=session, policy=DeliveryPolicy(max_retries=0))
+        with client.batch():
+            client.post(url="http://example.com/1", data=b"{}")
+            client.post(url="http://example.com/2", data=b"{}")
+        client.flush_threads[0].join()
+        assert 2 == session.post.call_count
+
+    def test_pooled_session(self, settings):
+        settings.HOOK_POOL_MAXSIZE = 42
+        session = build_session()
+        assert 42 == session.get_adapter("https://example.com")._pool_maxsize
+
+        client = SyncClient(session=make_session(), timeout=3)
+        client.post(url="http://example.com", data=b"{}")
+        assert 3 == client.session.post.call_args[1]["timeout"]
+
+    def test_retries(self):
+        session = make_session()
+        session.post.side_effect = [
+            requests.ConnectionError,
+            MagicMock(status_code=503, headers={}),
+            MagicMock(status_code=200, headers={}),
+        ]
+        policy = DeliveryPolicy(max_retries=3, backoff=0.01)
+        client = Client(num_threads=1, session=session, policy=policy)
+        client.post(url="http://example.com", data=b"{}")
+        for _ in range(100):
+            if session.post.call_count == 3 and not client.queue_depth:
+                break
+            time.sleep(0.01)
+        assert 3 == session.post.call_count
+        assert 0 == client.queue_depth
+
+    def test_deferred_fan_out(self, transactional_db, settings, mocker):
+        settings.HOOK_DEFER_FANOUT = True
+        settings.HOOK_FANOUT_CHUNK_SIZE = 2
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        for i in range(3):
+            Hook.objects.create(user=user, event="special.thing", target="http://a.com/%d" % i)
+        session = make_session()
+        client = Client(num_threads=2, session=session)
+        mocker.patch("drf_hooks.models.get_client", return_value=client)
+
+        Hook.find_and_fire_hooks("special.thing", {"hello": "world!"})
+        for _ in range(500):
+            if client.deferred_thread is None and client.total_sent == 3:
+                break
+            time.sleep(0.01)
+        assert 3 == session.post.call_count
+        assert not client.deferred
+
+    def test_deferred_serialization(self, transactional_db, settings, mocker):
+        settings.HOOK_DEFER_SERIALIZATION = True
+        settings.HOOK_SERIALIZATION_HINTS = {
+            "django_comments.Comment": {"select_related": ["user"]}
+        }
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        site = Site.objects.get_current()
+        Hook.objects.create(user=user, event="comment.added", target="http://a.com/added")
+        Hook.objects.create(user=user, event="comment.removed", target="http://a.com/removed")
+        session = make_session()
+        client = Client(num_threads=2, session=session)
+        mocker.patch("drf_hooks.models.get_client", return_value=client)
+        mocker.patch("drf_hooks.deferred.get_client", return_value=client)
+        serialize_model = mocker.spy(Hook, "serialize_model")
+        serialize_models = mocker.spy(Hook, "serialize_models")
+
+        with transaction.atomic():
+            for i in range(2):
+                Comment.objects.create(site=site, content_object=user, user=user, comment="%d" % i)
+            assert not client.deferred
+        for _ in range(500):
+            if client.deferred_thread is None and client.total_sent == 2:
+                break
+            time.sleep(0.01)
+        assert 2 == session.post.call_count
+        assert not serialize_model.called
+        instances = serialize_models.call_args[0][1]
+        assert 2 == len(instances)
+        assert "user" in instances[0]._state.fields_cache
+
+        # deleted instances are serialized right away
+        Comment.objects.first().delete()
+        assert 1 == serialize_model.call_count
+
+    def test_drain(self, mocker):
+        session = make_session()
+        release = threading.Event()
+        session.post.side_effect = lambda *args, **kwargs: release.wait(5) and MagicMock(
+            status_code=200
+        )
+        client = Client(num_threads=2, session=session, queue=DeliveryQueue())
+        mocker.patch.object(client_module, "__CLIENT", client)
+        with client.batch():
+            for i in range(3):
+                client.post(url="http://example.com/%d" % i, data=b"{}")
+
+        assert not client.drain(timeout=0.05)
+        assert 3 == client.undelivered
+        assert 3 == drain(timeout=0.05)
+        release.set()
+        assert 0 == drain(timeout=5)
+        assert 3 == client.total_sent
+
+    def test_sigterm_while_flushing(self, settings, mocker):
+        settings.HOOK_DRAIN_TIMEOUT = 0.2
+        client = Client(num_threads=1, session=make_session())
+        client.queue.put(("post", (), {"url": "http://example.com", "data": b"{}"}, 0))
+        mocker.patch.object(client_module, "__CLIENT", client)
+        received = []
+        original = signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+        try:
+            install_sigterm_handler()
+            started = time.monotonic()
+            # the signal interrupts the main thread while it holds a lock drain needs
+            with client.flush_lock:
+                os.kill(os.getpid(), signal.SIGTERM)
+                time.sleep(0.01)
+            assert time.monotonic() - started < 2
+            assert [signal.SIGTERM] == received
+        finally:
+            signal.signal(signal.SIGTERM, original)
+        assert client.drain(timeout=5)
+
+    def test_fork_resets_client(self, mocker):
+        mocker.patch.object(client_module, "__CLIENT", Client(num_threads=1))
+        pid = os.fork()
+        if not pid:
+            os._exit(0 if getattr(client_module, "__CLIENT") is None else 1)
+        assert 0 == os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+        assert getattr(client_module, "__CLIENT") is not None
+
+    def test_debounced_hooks(self, db, settings, mocker):
+        settings.HOOK_EVENTS = dict(
+            settings.HOOK_EVENTS,
+            **{"comment.changed": {"action": "django_comments.Comment.updated", "debounce": 100}},
+        )
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        Hook.objects.create(user=user, event="comment.changed", target="http://a.com/changed")
+        session = make_session()
+        client = Client(num_threads=2, session=session)
+        mocker.patch("drf_hooks.models.get_client", return_value=client)
+        comment = Comment.objects.create(
+            site=Site.objects.get_current(), content_object=user, user=user, comment="0"
+        )
+        for n in range(5):
+            comment.comment = str(n)
+            comment.save()
+        assert 0 == client.total_sent
+
+        assert client.drain(timeout=5)
+        assert 1 == session.post.call_count
+        assert "4" == json.loads(session.post.call_args[1]["data"])["data"]["comment"]
+
+
+class TestDeliveryPolicy:
+    def test_outcomes(self):
+        policy = DeliveryPolicy(max_retries=1, breaker_threshold=0)
+        ok, error = MagicMock(status_code=204), MagicMock(status_code=500, headers={})
+        assert SUCCESS == policy.outcome(None, "a.com", 0, response=ok)
+        assert RETRY == policy.outcome(None, "a.com", 0, response=error)
+        assert GIVE_UP == policy.outcome(None, "a.com", 1, response=error)
+        assert GIVE_UP == policy.outcome(None, "a.com", 0, response=MagicMock(status_code=400))
+        assert RETRY == policy.outcome(None, "a.com", 0, exception=requests.ConnectTimeout())
+
+        delay = policy.get_delay(0, MagicMock(headers={"Retry-After": "120"}))
+        assert 120 == delay
+
+    def test_circuit_breaker(self):
+        policy = DeliveryPolicy(breaker_threshold=2, breaker_timeout=60)
+        for _ in range(2):
+            assert policy.allow("a.com")
+            policy.outcome(None, "a.com", 0, exception=requests.ConnectionError())
+        assert not policy.allow("a.com")
+        assert policy.allow("b.com")
+        assert 59 < policy.breaker.retry_after("a.com") <= 60
+
+        policy.breaker.reset_timeout = 0
+        # a single trial delivery, which succeeds
+        assert policy.allow("a.com")
+        policy.outcome(None, "a.com", 0, response=MagicMock(status_code=200))
+        assert policy.allow("a.com")
+
+    def test_disable_hooks(self, db):
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        gone, failing = [
+            Hook.objects.create(user=user, event="special.thing", target="http://a.com/%d" % i)
+            for i in range(2)
+        ]
+        policy = DeliveryPolicy(max_retries=0, disable_after=2)
+        policy.outcome(gone.id, "a.com", 0, response=MagicMock(status_code=410))
+        assert not Hook.objects.filter(id=gone.id).exists()
+
+        error = MagicMock(status_code=500, headers={})
+        policy.outcome(failing.id, "a.com", 0, response=error)
+        assert Hook.objects.filter(id=failing.id).exists()
+        policy.outcome(failing.id, "a.com", 0, response=error)
+        assert not Hook.objects.filter(id=failing.id).exists()
+
+    def test_open_circuit_holds_deliveries(self, transactional_db):
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        hook = Hook.objects.create(user=user, event="special.thing", target="http://a.com/1")
+        session = make_session()
+        policy = DeliveryPolicy(max_retries=0, breaker_threshold=1, disable_after=1)
+        policy.breaker.failure("a.com")
+        client = Client(num_threads=1, session=session, policy=policy)
+        for _ in range(3):
+            client.post(url=hook.target, data=b"{}", hook_id=hook.id)
+            client.flush_threads[0].join()
+
+        # held back without using up attempts, nor disabling the hook
+        assert not session.post.called
+        assert 3 == client.queue_depth
+        assert Hook.objects.filter(id=hook.id).exists()
+        outcome, delay = client.send(("post", (), {"url": hook.target, "hook_id": hook.id}, 0))
+        assert outcome is None and 29 < delay <= 30
+
+
+class TestDeliveryQueue:
+    def make_item(self, n, size=10):
+        return ("post", (), {"url": "http://example.com/%d" % n, "data": b"x" * size})
+
+    def urls(self, queue):
+        items = iter(queue.get, None)
+        return sorted(item[2]["url"][-1] for item in items)
+
+    def test_drop_policies(self):
+        queue = DeliveryQueue(max_size=2, overflow="drop_newest")
+        assert all(queue.put(self.make_item(n)) for n in range(2))
+        assert not queue.put(self.make_item(2))
+        assert 1 == queue.dropped
+        assert ["0", "1"] == self.urls(queue)
+
+        queue = DeliveryQueue(max_bytes=25, overflow="drop_oldest")
+        assert all(queue.put(self.make_item(n)) for n in range(3))
+        assert 1 == queue.dropped
+        assert 20 == queue.size_bytes
+        assert ["1", "2"] == self.urls(queue)
+
+    def test_block(self):
+        queue = DeliveryQueue(max_size=1, overflow="block", block_timeout=0.01)
+        assert queue.put(self.make_item(0))
+        assert not queue.put(self.make_item(1))
+        assert 1 == queue.dropped
+
+    def test_spill(self, tmp_path):
+        queue = DeliveryQueue(max_size=2, overflow="spill", spill_dir=str(tmp_path))
+        assert all(queue.put(self.make_item(n)) for n in range(5))
+        assert 3 == queue.spilled
+        assert 5 == len(queue)
+        assert ["0", "1", "2", "3", "4"] == self.urls(queue)
+        assert 0 == len(queue)
+        assert not list(tmp_path.iterdir())
+
+    def test_client_counters(self):
+        session = make_session()
+        queue = DeliveryQueue(max_size=10)
+        client = Client(num_threads=1, session=session, queue=queue)
+        # an empty queue is still used
+        assert queue is client.queue
+        with client.batch():
+            client.post(url="http://example.com/1", data=b"{}")
+            client.post(url="http://example.com/2", data=b"{}")
+            assert 2 == client.queue_depth
+            assert 4 == client.queued_bytes
+        client.flush_threads[0].join()
+        assert 0 == client.queue_depth
+        assert 0 == client.dropped
+        assert 2 == session.post.call_count
+
+    def test_fair_scheduling(self):
+        queue = DeliveryQueue(max_per_host=1, weights={"b.com": 2})
+        for n in range(3):
+            queue.put(("post", (), {"url": "http://a.com/%d" % n}))
+        for n in range(3):
+            queue.put(("post", (), {"url": "http://b.com/%d" % n}))
+
+        first = queue.get()
+        assert "http://a.com/0" == first[2]["url"]
+        # a.com is busy, b.com gets its turn
+        second = queue.get()
+        assert "http://b.com/0" == second[2]["url"]
+        assert queue.get() is None
+
+        queue.task_done(first)
+        queue.task_done(second)
+        urls = []
+        for item in iter(queue.get, None):
+            urls.append(item[2]["url"])
+            queue.task_done(item)
+        # b.com has twice the weight of a.com, and deliveries stay in order per host
+        assert ["http://b.com/1", "http://a.com/1", "http://b.com/2", "http://a.com/2"] == urls
+
+    def test_debounce_queue(self):
+        queue = DeliveryQueue()
+        for n in range(3):
+            replaced = queue.debounce(("a", 1), ("post", (), {"url": "http://a.com/%d" % n}, 0), 0)
+            assert (n == 0) == (replaced is None)
+        queue.debounce(("b", 1), ("post", (), {"url": "http://b.com/0"}, 0), 60)
+        assert 2 == len(queue)
+
+        item = queue.get()
+        assert "http://a.com/2" == item[2]["url"]
+        queue.task_done(item)
+        # b.com's window isn't over
+        assert queue.get() is None
+        assert 1 == len(queue)
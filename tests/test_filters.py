@@ -0,0 +1,37 @@
+import pytest
+
+from drf_hooks.filters import FilterSyntaxError, compile_filter
+
+PAYLOAD = {"is_public": True, "score": 12, "user": {"name": "bob"}, "tags": ["a", "b"]}
+
+
+class TestFilters:
+    @pytest.mark.parametrize(
+        "expression, expected",
+        [
+            ("is_public == true", True),
+            ("is_public and score >= 10", True),
+            ("not is_public or score < 10", False),
+            ("(score < 5 or score > 10) and missing == null", True),
+            ('user.name in ["alice", "bob"]', True),
+            ("user.name not in ['bob']", False),
+            ("'a' in tags and tags.1 == 'b'", True),
+            ("score == 12.0 and score != -1", True),
+            # incompatible types don't match
+            ("score > 'a'", False),
+            # only nesting is limited, not the number of groups and lists
+            (" and ".join(["(score == 12)"] * 33), True),
+            (" or ".join(["score in [1]"] * 33), False),
+        ],
+    )
+    def test_matches(self, expression, expected):
+        assert expected == compile_filter(expression)(PAYLOAD)
+
+    @pytest.mark.parametrize(
+        "expression",
+        ["", "score ==", "score == == 1", "(score", "score 1", "__import__('os')", "[score] == 1"]
+        + ["(" * 40 + "score" + ")" * 40, "x" * 1001],
+    )
+    def test_syntax_errors(self, expression):
+        with pytest.raises(FilterSyntaxError):
+            compile_filter(expression)
@@ -1,5 +1,7 @@
+import gzip
 import json
 import typing as tp
+from decimal import Decimal
 from unittest.mock import MagicMock
 
 import pytest
@@ -13,13 +15,22 @@ CLIENT = get_client()
 
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
 from django.dispatch import receiver
 from django.test.signals import setting_changed
+from django.utils import timezone
 from django_comments.models import Comment
 from rest_framework import serializers
 
-from drf_hooks import models
+from drf_hooks import batching, encoders, index, models
 from drf_hooks.admin import HookForm
+from drf_hooks.bulk import HookQuerySet
+from drf_hooks.deferred import EventRef
+from drf_hooks.serializers import HookSerializer
+from drf_hooks.views import HookViewSet
 
 Hook = models.Hook
 
@@ -36,6 +47,8 @@ class CommentSerializer(serializers.ModelSerializer):
 def handle_hook_events_change(sender, setting, *args, **kwargs):
     if setting == "HOOK_EVENTS":
         models.clear_event_lookup()
+    if setting == "HOOK_SUBSCRIPTION_INDEX":
+        index.clear_subscription_index()
 
 
 @pytest.fixture
@@ -225,3 +238,568 @@ class TestDRFHooks:
         HookModel = get_hook_model()
         assert HookModel is Hook
         assert issubclass(HookModel, AbstractHook)
+
+    def test_subscription_index_skips_query(
+        self, settings, mocked_post, setup: tuple[User, Site], django_assert_num_queries
+    ):
+        settings.HOOK_SUBSCRIPTION_INDEX = True
+        user, site = setup
+        comment = Comment.objects.create(
+            site=site, content_object=user, user=user, comment="Hello world!"
+        )
+        # the index is loaded now, updating the comment only costs the UPDATE itself
+        comment.comment = "Goodbye world..."
+        with django_assert_num_queries(1):
+            comment.save()
+        assert not mocked_post.called
+
+        # creating a hook updates the index in place
+        target = "http://example.com/test_subscription_index_skips_query"
+        self.make_hook(user, "comment.changed", target)
+        comment.save()
+        payload = json.loads(mocked_post.call_args_list[0][1]["data"])
+        assert "comment.changed" == payload["hook"]["event"]
+
+    def test_subscription_index_version(self, settings, setup: tuple[User, Site]):
+        settings.HOOK_SUBSCRIPTION_INDEX = True
+        user, site = setup
+        subscriptions = index.get_subscription_index()
+        assert not subscriptions.has_subscribers("comment.added", user)
+
+        # another process adding a hook bumps the shared version
+        Hook.objects.bulk_create([Hook(user=user, event="comment.added", target="http://a.com")])
+        subscriptions.cache.incr(index.VERSION_KEY)
+        assert subscriptions.has_subscribers("comment.added", user)
+        assert subscriptions.has_subscribers("comment.added")
+        assert not subscriptions.has_subscribers("comment.added", user.pk + 1)
+
+        # an evicted counter doesn't come back to the version loaded
+        version = subscriptions.version
+        subscriptions.cache.delete(index.VERSION_KEY)
+        Hook.objects.bulk_create([Hook(user=user, event="comment.changed", target="http://a.com")])
+        assert version != subscriptions.get_remote_version()
+        assert subscriptions.has_subscribers("comment.changed", user)
+
+    def test_no_serialization_without_hooks(self, mocker, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        serialize_model = mocker.spy(Hook, "serialize_model")
+        comment = Comment.objects.create(
+            site=site, content_object=user, user=user, comment="Hello world!"
+        )
+        comment.delete()
+        assert not serialize_model.called
+
+        # serialized once, however many hooks receive it
+        target = "http://example.com/test_no_serialization_without_hooks"
+        self.make_hook(user, "comment.added", target)
+        self.make_hook(user, "comment.added", target + "/other")
+        Comment.objects.create(site=site, content_object=user, user=user, comment="Hello world!")
+        assert 1 == serialize_model.call_count
+        assert 2 == mocked_post.call_count
+
+    def test_payload_encoded_once(self, mocker, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        hooks = [
+            self.make_hook(user, "special.thing", "http://example.com/%d" % i) for i in range(3)
+        ]
+        encode_payload = mocker.spy(Hook, "encode_payload")
+        payload = {"hello": "world!", "when": hooks[0].created}
+        Hook.find_and_fire_hooks("special.thing", payload, user)
+        assert 1 == encode_payload.call_count
+
+        # the body is unchanged for existing consumers
+        for hook, call in zip(hooks, mocked_post.call_args_list):
+            expected = {
+                "hook": {"id": hook.id, "event": hook.event, "target": hook.target},
+                "data": payload,
+            }
+            assert json.dumps(expected, cls=DjangoJSONEncoder).encode() == call[1]["data"]
+
+    def test_orjson_encoder(self, settings, mocked_post, setup: tuple[User, Site]):
+        pytest.importorskip("orjson")
+        settings.HOOK_PAYLOAD_ENCODER = "drf_hooks.encoders.OrjsonEncoder"
+        user, site = setup
+        hook = self.make_hook(user, "special.thing", "http://example.com/test_orjson_encoder")
+        payload = {"hello": "wörld!", "when": hook.created, "amount": Decimal("1.10")}
+        Hook.find_and_fire_hooks("special.thing", payload, user)
+        expected = json.loads(json.dumps(payload, cls=DjangoJSONEncoder))
+        assert expected == json.loads(mocked_post.call_args[1]["data"])["data"]
+
+    def test_dispatch_table(self, settings, mocker, setup: tuple[User, Site]):
+        user, site = setup
+        handle_model_event = mocker.spy(Hook, "handle_model_event")
+        # models without events are not listened to at all
+        site.save()
+        user.save()
+        assert not handle_model_event.called
+
+        # changing the settings recompiles the table
+        settings.HOOK_EVENTS = {"site.changed": "sites.Site.updated+"}
+        Comment.objects.create(site=site, content_object=user, user=user, comment="Hello world!")
+        site.save()
+        assert 1 == handle_model_event.call_count
+        serializers = models.get_dispatch_table().serializers
+        assert CommentSerializer is serializers["django_comments.Comment"]
+
+    def test_defer_until_commit(
+        self,
+        settings,
+        mocker,
+        mocked_post,
+        setup: tuple[User, Site],
+        django_capture_on_commit_callbacks,
+    ):
+        settings.HOOK_DEFER_UNTIL_COMMIT = True
+        user, site = setup
+        target = "http://example.com/test_defer_until_commit"
+        for event in ("comment.added", "comment.changed", "comment.removed"):
+            self.make_hook(user, event, target)
+        serialize_model = mocker.spy(Hook, "serialize_model")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                comment = Comment.objects.create(
+                    site=site, content_object=user, user=user, comment="Hello world!"
+                )
+                comment.delete()
+        # created and deleted cancel out
+        assert not mocked_post.called
+        assert not serialize_model.called
+
+        with django_capture_on_commit_callbacks(execute=True):
+            comment = Comment.objects.create(
+                site=site, content_object=user, user=user, comment="Hello world!"
+            )
+        assert 1 == mocked_post.call_count
+
+        # many updates are coalesced into one
+        mocked_post.reset_mock()
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                for i in range(5):
+                    comment.comment = "Update %d" % i
+                    comment.save()
+                assert not mocked_post.called
+        assert 1 == mocked_post.call_count
+        payload = json.loads(mocked_post.call_args[1]["data"])
+        assert "comment.changed" == payload["hook"]["event"]
+        assert "Update 4" == payload["data"]["comment"]
+
+        # rolled back transactions don't send anything
+        mocked_post.reset_mock()
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    comment.save()
+                    raise ValueError
+        assert not mocked_post.called
+
+        # and neither do savepoints rolled back within a transaction
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                other = Comment.objects.create(
+                    site=site, content_object=user, user=user, comment="Kept"
+                )
+                with pytest.raises(ValueError):
+                    with transaction.atomic():
+                        comment.comment = "Rolled back"
+                        comment.save()
+                        Comment.objects.filter(pk=other.pk).delete()
+                        raise ValueError
+                with transaction.atomic():
+                    other.comment = "Kept and updated"
+                    other.save()
+        payloads = [json.loads(call[1]["data"]) for call in mocked_post.call_args_list]
+        assert ["comment.added", "comment.changed"] == [p["hook"]["event"] for p in payloads]
+        assert {other.pk} == {p["data"]["id"] for p in payloads}
+        assert {"Kept and updated"} == {p["data"]["comment"] for p in payloads}
+
+    def test_bulk_queryset(
+        self, mocker, mocked_post, setup: tuple[User, Site], django_assert_max_num_queries
+    ):
+        user, site = setup
+        other = User.objects.create_user("alice", "alice@example.com", "password")
+        target = "http://example.com/test_bulk_queryset"
+        for event in ("comment.added", "comment.changed", "comment.removed"):
+            self.make_hook(user, event, target)
+        serialize_models = mocker.spy(Hook, "serialize_models")
+        comments = HookQuerySet(Comment)
+
+        objs = [
+            Comment(
+                site=site,
+                content_object=user,
+                user=owner,
+                comment="Comment %d" % i,
+                submit_date=timezone.now(),
+            )
+            for i, owner in enumerate([user, other, user])
+        ]
+        # insert, subscribers and (single) content type lookup
+        with django_assert_max_num_queries(3):
+            comments.bulk_create(objs)
+        assert 1 == serialize_models.call_count
+        # only the comments of the subscribed user are serialized
+        assert 2 == len(serialize_models.call_args[0][1])
+        payloads = [json.loads(call[1]["data"]) for call in mocked_post.call_args_list]
+        assert ["Comment 0", "Comment 2"] == [p["data"]["comment"] for p in payloads]
+
+        mocked_post.reset_mock()
+        comments.filter(user=user).update(comment="Updated")
+        payloads = [json.loads(call[1]["data"]) for call in mocked_post.call_args_list]
+        assert ["comment.changed"] * 2 == [p["hook"]["event"] for p in payloads]
+        assert ["Updated"] * 2 == [p["data"]["comment"] for p in payloads]
+
+        # the rows of users without hooks are not fetched back
+        mocked_post.reset_mock()
+        with django_assert_max_num_queries(4):
+            comments.filter(user=other).update(comment="Updated")
+        assert 2 == serialize_models.call_count
+        assert not mocked_post.called
+        with django_assert_max_num_queries(1):
+            HookQuerySet(Site).update(name="example.org")
+
+        mocked_post.reset_mock()
+        comments.all().delete()
+        assert not Comment.objects.exists()
+        payloads = [json.loads(call[1]["data"]) for call in mocked_post.call_args_list]
+        assert ["comment.removed"] * 2 == [p["hook"]["event"] for p in payloads]
+        assert all(p["data"]["id"] for p in payloads)
+
+    def test_batched_delivery(self, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        target = "http://example.com/test_batched_delivery"
+        hook = Hook.objects.create(
+            user=user, event="comment.added", target=target, batch_size=2, batch_interval=0
+        )
+        objs = [
+            Comment(
+                site=site,
+                content_object=user,
+                user=user,
+                comment="Comment %d" % i,
+                submit_date=timezone.now(),
+            )
+            for i in range(3)
+        ]
+        HookQuerySet(Comment).bulk_create(objs)
+        # a full batch, then the rest at the end of the bulk operation
+        bodies = [json.loads(call[1]["data"]) for call in mocked_post.call_args_list]
+        assert [2, 1] == [len(body) for body in bodies]
+        assert ["Comment 0", "Comment 1", "Comment 2"] == [
+            item["data"]["comment"] for body in bodies for item in body
+        ]
+        assert {hook.id} == {item["hook"]["id"] for body in bodies for item in body}
+        assert target == mocked_post.call_args[1]["url"]
+
+    def test_batch_interval(self, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        self.make_hook(user, "special.thing", "http://example.com/test_batch_interval")
+        Hook.objects.update(batch_size=10, batch_interval=50)
+        Hook.find_and_fire_hooks("special.thing", {"n": 1}, user)
+        Hook.find_and_fire_hooks("special.thing", {"n": 2}, user)
+        assert not mocked_post.called
+
+        batcher = batching.get_batcher()
+        for batch in list(batcher.pending.values()):
+            batch.timer.join()
+        assert 1 == mocked_post.call_count
+        body = json.loads(mocked_post.call_args[1]["data"])
+        assert [{"n": 1}, {"n": 2}] == [item["data"] for item in body]
+
+    def test_invalid_event_options(self, mocker):
+        from django.conf import settings
+
+        for options in ({"debounce": -1}, {"delta": True}):
+            action = dict(options, action="django_comments.Comment.created")
+            mocker.patch.object(settings, "HOOK_EVENTS", {"comment.added": action})
+            models.clear_event_lookup()
+            with pytest.raises(ImproperlyConfigured):
+                models.get_event_lookup()
+        models.clear_event_lookup()
+
+    def test_watched_fields(self, settings, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        settings.HOOK_EVENTS = dict(
+            settings.HOOK_EVENTS,
+            **{
+                "comment.changed": {
+                    "action": "django_comments.Comment.updated",
+                    "fields": ["comment"],
+                }
+            },
+        )
+        self.make_hook(user, "comment.changed", "http://example.com/test_watched_fields")
+        comment = Comment.objects.create(site=site, content_object=user, user=user, comment="Hello")
+        comment.is_public = False
+        comment.save()
+        assert not mocked_post.called
+
+        comment.comment = "Changed"
+        comment.save()
+        assert 1 == mocked_post.call_count
+        comment.save()
+        assert 1 == mocked_post.call_count
+
+        # only the saved fields count
+        comment.comment = "Not saved"
+        comment.save(update_fields=["is_public"])
+        assert 1 == mocked_post.call_count
+
+        # snapshots are taken when loading too
+        comment = Comment.objects.get(pk=comment.pk)
+        comment.comment = "Loaded"
+        comment.save()
+        assert 2 == mocked_post.call_count
+        assert "Loaded" == json.loads(mocked_post.call_args[1]["data"])["data"]["comment"]
+
+    def test_delta(self, settings, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        settings.HOOK_EVENTS = dict(
+            settings.HOOK_EVENTS,
+            **{
+                "comment.changed": {
+                    "action": "django_comments.Comment.updated",
+                    "fields": ["comment", "is_public"],
+                    "delta": True,
+                }
+            },
+        )
+        self.make_hook(user, "comment.changed", "http://example.com/test_delta")
+        comment = Comment.objects.create(site=site, content_object=user, user=user, comment="Hello")
+        comment.comment = "Changed"
+        comment.save()
+        data = json.loads(mocked_post.call_args[1]["data"])["data"]
+        assert {"id": comment.pk, "comment": "Changed"} == data
+
+        settings.HOOK_SERIALIZERS = {}
+        comments = HookQuerySet(Comment)
+        comments.update(is_removed=True)
+        assert 1 == mocked_post.call_count
+        comments.update(is_public=False)
+        data = json.loads(mocked_post.call_args[1]["data"])["data"]
+        assert {"is_public": False} == data["fields"]
+        assert comment.pk == data["pk"]
+
+    def test_fan_out_in_chunks(
+        self, settings, django_assert_num_queries, mocked_post, setup: tuple[User, Site]
+    ):
+        user, site = setup
+        settings.HOOK_FANOUT_CHUNK_SIZE = 2
+        for i in range(5):
+            self.make_hook(user, "special.thing", "http://example.com/chunk/%d" % i)
+
+        with django_assert_num_queries(3) as context:
+            Hook.find_and_fire_hooks("special.thing", {"n": 1})
+        assert 5 == mocked_post.call_count
+        # only the columns needed for delivering
+        assert all('"created"' not in query["sql"] for query in context.captured_queries)
+
+    def test_read_database(self, settings, mocker, setup: tuple[User, Site]):
+        assert "default" == Hook.find_hooks("comment.added").db
+        settings.HOOK_DATABASE_ALIAS = "replica"
+        assert "replica" == Hook.find_hooks("comment.added").db
+        assert "replica" == Hook.get_read_queryset().db
+        # the subscription index reads the primary, which has every hook
+        settings.HOOK_SUBSCRIPTION_INDEX = True
+        assert not index.get_subscription_index().has_subscribers("comment.added")
+
+        # the API reads and writes on the primary
+        mocker.patch("drf_hooks.views.router.db_for_write", return_value="primary")
+        assert "primary" == HookViewSet().get_queryset().db
+
+    def test_filter_and_fields(self, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        Hook.objects.create(
+            user=user,
+            event="comment.added",
+            target="http://example.com/private",
+            filter="is_public == false",
+        )
+        Hook.objects.create(
+            user=user,
+            event="comment.added",
+            target="http://example.com/fields",
+            fields=["id", "comment"],
+        )
+        comment = Comment.objects.create(site=site, content_object=user, user=user, comment="Hello")
+
+        assert 1 == mocked_post.call_count
+        assert "http://example.com/fields" == mocked_post.call_args[1]["url"]
+        data = json.loads(mocked_post.call_args[1]["data"])["data"]
+        assert {"id": comment.pk, "comment": "Hello"} == data
+
+    def test_invalid_filter(self, setup: tuple[User, Site]):
+        user, site = setup
+        form = HookForm(
+            data={
+                "user": user.id,
+                "target": "http://example.com",
+                "event": "comment.added",
+                "headers": json.dumps({"Content-Type": "application/json"}),
+                "filter": "is_public ==",
+            }
+        )
+        assert not form.is_valid()
+        assert "filter" in form.errors
+
+        request = MagicMock(user=user)
+        serializer = HookSerializer(
+            data={"target": "http://example.com", "event": "comment.added", "fields": "id"},
+            context={"request": request},
+        )
+        assert not serializer.is_valid()
+        assert "fields" in serializer.errors
+
+    def test_compressed_delivery(self, mocker, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        hooks = [
+            Hook.objects.create(
+                user=user,
+                event="special.thing",
+                target="http://example.com/%d" % i,
+                content_encoding="gzip",
+            )
+            for i in range(3)
+        ]
+        compress_segment = mocker.spy(encoders, "compress_segment")
+        payload = {"text": "Hello world! " * 100}
+        Hook.find_and_fire_hooks("special.thing", payload, user)
+        # the payload is compressed once, the envelopes of each hook are stored
+        assert 1 == compress_segment.call_count
+        for hook, call in zip(hooks, mocked_post.call_args_list):
+            assert "gzip" == call[1]["headers"]["Content-Encoding"]
+            assert "application/json" == call[1]["headers"]["Content-Type"]
+            body = json.loads(gzip.decompress(call[1]["data"]))
+            assert hook.id == body["hook"]["id"]
+            assert payload == body["data"]
+            assert len(call[1]["data"]) < 200
+
+    def test_compressed_zstd(self, mocked_post, setup: tuple[User, Site]):
+        zstandard = pytest.importorskip("zstandard")
+        user, site = setup
+        hook = Hook.objects.create(
+            user=user, event="special.thing", target="http://example.com", content_encoding="zstd"
+        )
+        Hook.find_and_fire_hooks("special.thing", {"hello": "world!"}, user)
+        assert "zstd" == mocked_post.call_args[1]["headers"]["Content-Encoding"]
+        body = json.loads(zstandard.decompress(mocked_post.call_args[1]["data"]))
+        assert {"hello": "world!"} == body["data"]
+        assert hook.id == body["hook"]["id"]
+
+    def test_compressed_batch(self, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        self.make_hook(user, "special.thing", "http://example.com/test_compressed_batch")
+        Hook.objects.update(batch_size=2, batch_interval=0, content_encoding="gzip")
+        with batching.get_batcher().batch():
+            for n in range(2):
+                Hook.find_and_fire_hooks("special.thing", {"n": n}, user)
+        assert 1 == mocked_post.call_count
+        assert "gzip" == mocked_post.call_args[1]["headers"]["Content-Encoding"]
+        body = json.loads(gzip.decompress(mocked_post.call_args[1]["data"]))
+        assert [{"n": 0}, {"n": 1}] == [item["data"] for item in body]
+
+    def test_oversize_payload(self, settings, mocker, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        settings.HOOK_MAX_PAYLOAD_SIZE = 100
+        increment = mocker.spy(models.get_metrics(), "increment")
+        self.make_hook(user, "special.thing", "http://example.com/test_oversize_payload")
+        Hook.find_and_fire_hooks("special.thing", {"id": 1, "text": "x" * 100}, user)
+        data = json.loads(mocked_post.call_args[1]["data"])["data"]
+        assert {"id": 1, "truncated": True} == data
+        increment.assert_any_call("drf_hooks_oversize_total", policy="stub")
+
+        # payloads without an id and with the drop policy are not delivered
+        Hook.find_and_fire_hooks("special.thing", {"text": "x" * 100}, user)
+        settings.HOOK_OVERSIZE_POLICY = "drop"
+        Hook.find_and_fire_hooks("special.thing", {"id": 1, "text": "x" * 100}, user)
+        Hook.find_and_fire_hooks("special.thing", {"id": 1, "text": "small"}, user)
+        assert 2 == mocked_post.call_count
+        assert 2 == increment.call_args_list.count(
+            mocker.call("drf_hooks_oversize_total", policy="drop")
+        )
+
+    def test_backfill(self, tmp_path, mocked_post, setup: tuple[User, Site]):
+        user, site = setup
+        other = User.objects.create_user("alice", "alice@example.com", "password")
+        comments = [
+            Comment.objects.create(site=site, content_object=user, user=user, comment=str(i))
+            for i in range(5)
+        ]
+        Comment.objects.create(site=site, content_object=other, user=other, comment="Other")
+        hook = self.make_hook(user, "comment.added", "http://example.com/test_backfill")
+        self.make_hook(other, "comment.added", "http://example.com/other")
+        checkpoint = str(tmp_path / "checkpoint.json")
+
+        call_command(
+            "hooks_backfill",
+            "comment.added",
+            "--user=bob",
+            "--chunk-size=2",
+            "--filter=comment__lte=2",
+            "--filter=is_public=1",
+            "--checkpoint=" + checkpoint,
+        )
+        bodies = [json.loads(call[1]["data"]) for call in mocked_post.call_args_list]
+        assert ["0", "1", "2"] == [body["data"]["comment"] for body in bodies]
+        assert {hook.id} == {body["hook"]["id"] for body in bodies}
+        with open(checkpoint) as f:
+            assert comments[2].pk == json.load(f)["after"]
+
+        # resumes after the checkpoint
+        mocked_post.reset_mock()
+        call_command(
+            "hooks_backfill", "comment.added", "--hook=%d" % hook.id, "--checkpoint=" + checkpoint
+        )
+        bodies = [json.loads(call[1]["data"]) for call in mocked_post.call_args_list]
+        assert ["3", "4"] == [body["data"]["comment"] for body in bodies]
+
+        with pytest.raises(CommandError):
+            call_command("hooks_backfill", "comment.removed")
+        with pytest.raises(CommandError):
+            call_command("hooks_backfill", "special.thing")
+
+    def test_deliver_hook_override(self, mocker, setup: tuple[User, Site]):
+        user, site = setup
+        for event in ("comment.added", "comment.changed"):
+            self.make_hook(user, event, "http://example.com/test_deliver_hook_override")
+        delivered = []
+
+        # the signature documented for custom hook models
+        def deliver_hook(self, serialized_hook):
+            delivered.append(json.loads(serialized_hook)["hook"]["event"])
+
+        mocker.patch.object(Hook, "deliver_hook", deliver_hook)
+        comment = Comment.objects.create(site=site, content_object=user, user=user, comment="Hi")
+        comment.comment = "Hello"
+        comment.save()
+        HookQuerySet(Comment).bulk_create(
+            [Comment(site=site, content_object=user, user=user, submit_date=timezone.now())]
+        )
+        assert ["comment.added", "comment.changed", "comment.added"] == delivered
+
+    def test_deferred_events_read_the_database_saved_to(
+        self, mocker, mocked_post, setup: tuple[User, Site]
+    ):
+        user, site = setup
+        self.make_hook(user, "comment.added", "http://example.com/test_deferred_events")
+        comment = Comment.objects.create(site=site, content_object=user, user=user, comment="Hi")
+        mocked_post.reset_mock()
+        # comments are read from a replica which doesn't have them yet
+        db_for_read = router.db_for_read
+        mocker.patch.object(
+            router,
+            "db_for_read",
+            lambda model, **hints: "replica" if model is Comment else db_for_read(model, **hints),
+        )
+        increment = mocker.patch("drf_hooks.models.get_metrics").return_value.increment
+
+        label = Comment._meta.label
+        Hook.fire_deferred_events(
+            [
+                EventRef(label, comment.pk, "created", None, "default"),
+                EventRef(label, comment.pk + 1, "created", None, "default"),
+            ]
+        )
+        assert "Hi" == json.loads(mocked_post.call_args[1]["data"])["data"]["comment"]
+        increment.assert_called_once_with("drf_hooks_deferred_missing_total", 1, model=label)
@@ -0,0 +1,107 @@
+import os
+import socket
+import time
+
+import pytest
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory
+from django_comments.models import Comment
+from rest_framework.test import force_authenticate
+
+from drf_hooks import metrics
+from drf_hooks.models import Hook
+from drf_hooks.views import MetricsView
+from tests.test_hooks import CLIENT
+
+
+@pytest.fixture
+def recorder(settings):
+    settings.HOOK_METRICS = "drf_hooks.metrics.InMemoryMetrics"
+    settings.HOOK_METRICS_INTERVAL = 0
+    metrics.clear_metrics()
+    cache.clear()
+    yield metrics.get_metrics()
+    metrics.clear_metrics()
+
+
+@pytest.fixture
+def mocked_session(mocker):
+    return mocker.patch.object(CLIENT, "session")
+
+
+class TestMetrics:
+    def test_stages_are_recorded(self, db, recorder, mocked_session):
+        mocked_session.post.return_value.status_code = 200
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        site = Site.objects.get_current()
+        Hook.objects.create(user=user, event="comment.added", target="http://a.com/hooks")
+        Comment.objects.create(site=site, content_object=user, user=user, comment="Hello")
+
+        collected = metrics.collect()
+        counters = collected["counters"]
+        model = (("action", "created"), ("model", "django_comments.Comment"))
+        assert 1 == counters[("drf_hooks_signals_total", model)]
+        assert 1 == counters[("drf_hooks_events_total", (("event", "comment.added"),))]
+        status = (("host", "a.com"), ("status", "200"))
+        assert 1 == counters[("drf_hooks_responses_total", status)]
+        timings = {name for name, tags in collected["histograms"]}
+        assert {
+            "drf_hooks_find_hooks_seconds",
+            "drf_hooks_serialize_seconds",
+            "drf_hooks_encode_seconds",
+            "drf_hooks_deliver_seconds",
+        } <= timings
+
+    def test_merge_and_render(self, settings, recorder):
+        recorder.increment("drf_hooks_dropped_total", 2)
+        recorder.timing("drf_hooks_deliver_seconds", 0.02, host="a.com")
+        # another process
+        other = metrics.InMemoryMetrics()
+        other.interval = 3600
+        other.increment("drf_hooks_dropped_total")
+        other.timing("drf_hooks_deliver_seconds", 3, host="a.com")
+        snapshot = other.snapshot()
+        cache.set(metrics.SNAPSHOT_KEY % "other:1", snapshot)
+        processes = cache.get(metrics.REGISTRY_KEY)
+        cache.set(metrics.REGISTRY_KEY, dict(processes, **{"other:1": time.time() + 60}))
+
+        text = metrics.render_prometheus(metrics.collect())
+        assert "# TYPE drf_hooks_dropped_total counter\ndrf_hooks_dropped_total 3\n" in text
+        assert 'drf_hooks_deliver_seconds_bucket{host="a.com",le="0.025"} 1\n' in text
+        assert 'drf_hooks_deliver_seconds_bucket{host="a.com",le="+Inf"} 2\n' in text
+        assert 'drf_hooks_deliver_seconds_count{host="a.com"} 2\n' in text
+
+    def test_command_and_view(self, db, recorder, capsys):
+        recorder.timing("drf_hooks_encode_seconds", 0.002, event="comment.added")
+        call_command("hooks_metrics")
+        out = capsys.readouterr().out
+        assert "drf_hooks_encode_seconds event=comment.added: count=1" in out
+
+        request = RequestFactory().get("/webhooks/metrics/")
+        assert 403 == MetricsView.as_view()(request).status_code
+        admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        request = RequestFactory().get("/webhooks/metrics/")
+        force_authenticate(request, user=admin)
+        response = MetricsView.as_view()(request)
+        assert 200 == response.status_code
+        assert b"drf_hooks_encode_seconds_count" in response.content
+
+    def test_registry_is_pruned(self, recorder, mocker):
+        process = "%s:%d" % (socket.gethostname(), os.getpid())
+        recorder.increment("drf_hooks_dropped_total")
+        now = time.time()
+        processes = cache.get(metrics.REGISTRY_KEY)
+        processes.update({"dead:1": now - 1, "alive:1": now + 60})
+        cache.set(metrics.REGISTRY_KEY, processes)
+        assert {process, "alive:1"} == set(metrics.get_live_processes(cache))
+
+        # only rewritten when the entry of this process is about to expire
+        cache_set = mocker.spy(cache, "set")
+        recorder.increment("drf_hooks_dropped_total")
+        assert metrics.REGISTRY_KEY not in [call[0][0] for call in cache_set.call_args_list]
+        mocker.patch("drf_hooks.metrics.time.time", return_value=now + 50)
+        recorder.increment("drf_hooks_dropped_total")
+        assert {process, "alive:1"} == set(cache.get(metrics.REGISTRY_KEY))
@@ -0,0 +1,107 @@
+import json
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+
+from drf_hooks.models import Delivery, Hook
+from drf_hooks.outbox import OutboxClient, OutboxWorker
+from drf_hooks.retry import DeliveryPolicy
+
+
+@pytest.fixture
+def outbox(mocker):
+    client = OutboxClient()
+    mocker.patch("drf_hooks.models.get_client", return_value=client)
+    return client
+
+
+class TestOutbox:
+    def test_deliveries_are_batched(self, db, outbox, django_assert_num_queries):
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        hooks = [
+            Hook.objects.create(user=user, event="special.thing", target="http://a.com/%d" % i)
+            for i in range(3)
+        ]
+        # the hooks query and a single insert
+        with django_assert_num_queries(2):
+            Hook.find_and_fire_hooks("special.thing", {"hello": "world!"}, user)
+
+        deliveries = list(Delivery.objects.order_by("id"))
+        assert [hook.id for hook in hooks] == [d.hook_id for d in deliveries]
+        assert {"hello": "world!"} == json.loads(bytes(deliveries[0].body))["data"]
+        assert Delivery.PENDING == deliveries[0].status
+
+    def test_worker(self, db, outbox):
+        for i in range(5):
+            outbox.post(url="http://a.com/%d" % i, data=b"{}", headers={})
+        session = MagicMock()
+        session.post.side_effect = lambda url, **kwargs: MagicMock(
+            status_code=500 if url.endswith("4") else 200, headers={}
+        )
+        policy = DeliveryPolicy(max_retries=1, backoff=0)
+        worker = OutboxWorker(batch_size=2, session=session, policy=policy)
+
+        claimed = worker.claim()
+        assert 2 == len(claimed)
+        # another worker doesn't get the same rows
+        assert not {d.id for d in claimed} & {d.id for d in OutboxWorker(batch_size=10).claim()}
+
+        Delivery.objects.update(claimed_by="", claimed_until=None)
+        assert 6 == worker.drain()
+        failed = Delivery.objects.get()
+        assert "http://a.com/4" == failed.target
+        assert Delivery.FAILED == failed.status
+        assert 2 == failed.attempts
+
+    def test_command(self, db, outbox, mocker):
+        outbox.post(url="http://a.com", data=b"{}", headers={})
+        session = MagicMock()
+        session.post.return_value.status_code = 200
+        mocker.patch("drf_hooks.outbox.build_session", return_value=session)
+        call_command("hooks_worker", "--once")
+        assert not Delivery.objects.exists()
+        assert 1 == session.post.call_count
+
+    def test_open_circuit_releases_deliveries(self, db, outbox):
+        outbox.post(url="http://a.com/1", data=b"{}", headers={})
+        session = MagicMock()
+        policy = DeliveryPolicy(breaker_threshold=1, breaker_timeout=60)
+        policy.breaker.failure("a.com")
+        worker = OutboxWorker(session=session, policy=policy)
+
+        assert 1 == worker.run_once()
+        assert not session.post.called
+        delivery = Delivery.objects.get()
+        assert 0 == delivery.attempts
+        assert Delivery.PENDING == delivery.status
+        # not due again until the circuit lets a delivery through
+        assert 0 == worker.run_once()
+
+    def test_claims_are_renewed(self, db, outbox, mocker):
+        outbox.post(url="http://a.com/1", data=b"{}", headers={})
+        outbox.post(url="http://a.com/2", data=b"{}", headers={})
+        session = MagicMock()
+        session.post.side_effect = lambda url, **kwargs: time.sleep(0.2) or MagicMock(
+            status_code=200, headers={}
+        )
+        worker = OutboxWorker(session=session, lease=0.1)
+        renewed = []
+        renew = worker.renew
+
+        def renew_and_lose(token):
+            expected = timezone.now() + timedelta(seconds=0.1)
+            renew(token)
+            renewed.append(Delivery.objects.filter(claimed_by=token)[0].claimed_until >= expected)
+            # the claim of this row expired anyway, and another worker took it over
+            Delivery.objects.filter(target="http://a.com/2").update(claimed_by="other")
+
+        mocker.patch.object(worker, "renew", side_effect=renew_and_lose)
+        assert 2 == worker.run_once()
+        assert renewed and all(renewed)
+        # the row claimed by the other worker is left alone
+        assert ["http://a.com/2"] == [d.target for d in Delivery.objects.all()]
@@ -0,0 +1,168 @@
+import json
+import os
+import time
+
+import pytest
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django_comments.models import Comment
+
+from drf_hooks.client import AdaptiveConcurrency
+from drf_hooks.management.commands.hooks_deliver import Command
+from drf_hooks.models import Hook
+from drf_hooks.retry import DeliveryPolicy
+from drf_hooks.spool import Spool, SpoolClient, SpoolWorker, get_worker_name
+from tests.test_client import make_session
+
+
+def get_dead_pid():
+    pid = os.fork()
+    if not pid:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+
+@pytest.fixture
+def spool_dir(settings, tmp_path):
+    settings.HOOK_SPOOL_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def spool_client(mocker, spool_dir):
+    client = SpoolClient(str(spool_dir))
+    mocker.patch("drf_hooks.models.get_client", return_value=client)
+    return client
+
+
+class TestSpool:
+    def test_events_are_written_together(self, db, spool_client, spool_dir):
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        for i in range(3):
+            Hook.objects.create(user=user, event="special.thing", target="http://a.com/%d" % i)
+        Hook.find_and_fire_hooks("special.thing", {"hello": "world!"}, user)
+
+        names = os.listdir(spool_dir / "new")
+        assert 1 == len(names)
+        assert not os.listdir(spool_dir / "tmp")
+        deliveries = spool_client.spool.read(str(spool_dir / "new" / names[0]))
+        assert ["http://a.com/%d" % i for i in range(3)] == [d["url"] for d in deliveries]
+
+    def test_worker(self, spool_client, spool_dir):
+        with spool_client.batch():
+            spool_client.post(url="http://a.com/1", data=b"{}", headers={})
+            spool_client.post(url="http://b.com/1", data=b"{}", headers={})
+        spool_client.post(url="http://a.com/2", data=b"{}", headers={})
+        session = make_session(status_code=500)
+        worker = SpoolWorker(
+            Spool(str(spool_dir)), concurrency=4, session=session, policy=DeliveryPolicy(0)
+        )
+
+        assert 3 == worker.run_once()
+        assert worker.drain(timeout=5)
+        assert 3 == session.post.call_count
+        # failed deliveries are done with too
+        assert not os.listdir(spool_dir / "new")
+        assert not os.listdir(spool_dir / "cur" / worker.name)
+
+    def test_recover(self, spool_client, spool_dir):
+        spool_client.post(url="http://a.com/1", data=b"{}", headers={})
+        spool = Spool(str(spool_dir))
+        assert 1 == len(spool.claim("dead-worker", limit=10))
+        assert not spool.claim("other-worker", limit=10)
+        spool.recover()
+        assert 1 == len(spool.claim("other-worker", limit=10))
+
+    def test_recover_dead(self, spool_client, spool_dir):
+        for i in range(2):
+            spool_client.post(url="http://a.com/%d" % i, data=b"{}", headers={})
+        spool = Spool(str(spool_dir))
+        dead, alive = get_worker_name(get_dead_pid()), get_worker_name()
+        assert 1 == len(spool.claim(dead, limit=1))
+        assert 1 == len(spool.claim(alive, limit=1))
+        spool.recover_dead()
+        assert 1 == len(os.listdir(spool_dir / "new"))
+        assert 1 == len(os.listdir(spool_dir / "cur" / alive))
+        assert not os.path.exists(spool_dir / "cur" / dead)
+
+    def test_command(self, spool_client, mocker):
+        spool_client.post(url="http://a.com", data=b"{}", headers={})
+        session = make_session()
+        mocker.patch("drf_hooks.client.build_session", return_value=session)
+        call_command("hooks_deliver", "--once")
+        assert 1 == session.post.call_count
+
+    def test_dead_workers_are_recovered(self, spool_client, spool_dir, mocker):
+        spool_client.post(url="http://a.com", data=b"{}", headers={})
+        spool = Spool(str(spool_dir))
+        pid = get_dead_pid()
+        assert 1 == len(spool.claim(get_worker_name(pid), limit=10))
+        dead = mocker.Mock(pid=pid, **{"is_alive.return_value": False})
+        alive = mocker.Mock(pid=os.getpid(), **{"is_alive.return_value": True})
+        start = mocker.Mock()
+        workers = [dead, alive]
+
+        Command().restart_workers(spool, workers, start)
+        assert [start.return_value, alive] == workers
+        assert 1 == len(os.listdir(spool_dir / "new"))
+        assert not os.path.exists(spool_dir / "cur" / get_worker_name(pid))
+
+    def test_adaptive_concurrency(self):
+        limiter = AdaptiveConcurrency(initial=2, max_limit=4, target_latency=0.05)
+        for _ in range(10):
+            limiter.record("a.com", 0.01, ok=True)
+        assert 4 == limiter.get_limit("a.com")
+        limiter.record("a.com", 0.01, ok=False)
+        assert 2 == limiter.get_limit("a.com")
+        # a burst of failures only halves it once
+        limiter.record("a.com", 0.01, ok=False)
+        assert 2 == limiter.get_limit("a.com")
+        time.sleep(0.05)
+        limiter.record("a.com", 0.5, ok=True)
+        assert 1 == limiter.get_limit("a.com")
+        assert 2 == limiter.get_limit("b.com")
+
+    def test_deferred_fan_out(self, db, settings, spool_client, spool_dir):
+        settings.HOOK_DEFER_FANOUT = True
+        settings.HOOK_FANOUT_CHUNK_SIZE = 2
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        for i in range(3):
+            Hook.objects.create(user=user, event="special.thing", target="http://a.com/%d" % i)
+        Hook.find_and_fire_hooks("special.thing", {"hello": "world!"})
+
+        names = os.listdir(spool_dir / "new")
+        assert 1 == len(names)
+        assert [{"fan_out": "special.thing", "data": b'{"hello": "world!"}'}] == (
+            spool_client.spool.read(str(spool_dir / "new" / names[0]))
+        )
+
+        session = make_session()
+        worker = SpoolWorker(Spool(str(spool_dir)), concurrency=4, session=session)
+        # the fan-out, then a file per chunk
+        assert 4 == worker.run_once()
+        assert worker.drain(timeout=5)
+        assert 3 == session.post.call_count
+        assert not os.listdir(spool_dir / "new")
+
+    def test_deferred_serialization(
+        self, db, settings, mocker, spool_client, spool_dir, django_capture_on_commit_callbacks
+    ):
+        settings.HOOK_DEFER_SERIALIZATION = True
+        mocker.patch("drf_hooks.deferred.get_client", return_value=spool_client)
+        user = User.objects.create_user("bob", "bob@example.com", "password")
+        Hook.objects.create(user=user, event="comment.added", target="http://a.com/1")
+        with django_capture_on_commit_callbacks(execute=True):
+            comment = Comment.objects.create(
+                site=Site.objects.get_current(), content_object=user, user=user, comment="Hi"
+            )
+
+        names = os.listdir(spool_dir / "new")
+        ref = ("django_comments.Comment", comment.pk, "created", None, "default")
+        assert [{"events": [ref]}] == spool_client.spool.read(str(spool_dir / "new" / names[0]))
+        session = make_session()
+        worker = SpoolWorker(Spool(str(spool_dir)), concurrency=4, session=session)
+        assert 2 == worker.run_once()
+        assert worker.drain(timeout=5)
+        assert "Hi" == json.loads(session.post.call_args[1]["data"])["data"]["comment"]